@@ -2,15 +2,66 @@
 Face Authentication Attendance System
 Main Flask Application Entry Point
 """
-from flask import Flask
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import warnings
+from flask import Flask, jsonify
 from config import Config
 
 
+def _start_log_listener(queue_handler, stream_handler):
+    """Give queue_handler a fresh queue drained into stream_handler by a new listener thread"""
+    queue_handler.queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+def configure_logging():
+    """
+    Route log records through a queue so request threads only enqueue them;
+    a background listener writes them to stderr
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers):
+        return
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    queue_handler = logging.handlers.QueueHandler(None)
+    _start_log_listener(queue_handler, stream_handler)
+    
+    # The listener thread does not survive fork (gunicorn --preload), so each
+    # worker starts its own; otherwise its records would pile up undrained
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: _start_log_listener(queue_handler, stream_handler))
+    
+    root.addHandler(queue_handler)
+    root.setLevel(Config.LOG_LEVEL)
+
+
 def create_app():
     """Application factory"""
+    configure_logging()
     app = Flask(__name__)
     app.config.from_object(Config)
     
+    # Use orjson for jsonify() and request.get_json() when installed
+    from utils.json_provider import OrjsonProvider, orjson
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    
+    # Compress JSON list responses (today, report, user lists)
+    try:
+        from flask_compress import Compress
+        Compress(app)
+    except ImportError:
+        pass
+    
     # Register blueprints
     from routes import main_bp, admin_bp, users_bp, attendance_bp
     
@@ -19,6 +70,13 @@ def create_app():
     app.register_blueprint(users_bp)
     app.register_blueprint(attendance_bp)
     
+    @app.errorhandler(413)
+    def payload_too_large(e):
+        return jsonify({
+            "success": False,
+            "message": "Request payload too large"
+        }), 413
+    
     return app
 
 
@@ -27,26 +85,40 @@ app = create_app()
 
 
 if __name__ == '__main__':
-    from services import FaceRecognitionService
+    from services import get_face_service
     from services.admin_auth import get_admin_auth_service
+    from services.face_recognition import dlib_uses_simd
     from models import Database, AdminDatabase
     
-    face_service = FaceRecognitionService()
+    if not Config.DLIB_SIMD_OK and not dlib_uses_simd():
+        warnings.warn(
+            "dlib was built without AVX/NEON; face detection will be slow. "
+            "See README 'SIMD-optimized dlib build' or set DLIB_SIMD_OK=true."
+        )
+    
+    face_service = get_face_service()
     admin_service = get_admin_auth_service()
     
-    print("=" * 60)
-    print("  Face Authentication Attendance System")
-    print("=" * 60)
-    print(f"  Detection Model:   {Config.FACE_DETECTION_MODEL.upper()}")
-    print(f"  Registered Users:  {face_service.get_registered_count()}")
-    print(f"  Registered Admins: {admin_service.face_service.get_registered_count()}")
-    print(f"  Main Database:     {'Connected' if Database.is_connected() else 'Not configured'}")
-    print(f"  Admin Database:    {'Connected' if AdminDatabase.is_connected() else 'Not configured'}")
-    print(f"  First Admin Setup: {'Required' if admin_service.is_first_admin() else 'Complete'}")
-    print(f"  Spoof Detection:   {'Enabled' if Config.SPOOF_DETECTION_ENABLED else 'Disabled'}")
-    print(f"  Quick Mode:        {'Enabled' if Config.SPOOF_QUICK_MODE else 'Disabled'}")
-    print("=" * 60)
-    print(f"  Server starting on http://{Config.HOST}:{Config.PORT}")
-    print("=" * 60)
+    separator = "=" * 60
+    banner = "\n".join([
+        separator,
+        "  Face Authentication Attendance System",
+        separator,
+        f"  Detection Model:   {Config.FACE_DETECTION_MODEL.upper()}",
+        f"  Registered Users:  {face_service.get_registered_count()}",
+        f"  Registered Admins: {admin_service.face_service.get_registered_count()}",
+        f"  Main Database:     {'Connected' if Database.is_connected() else 'Not configured'}",
+        f"  Admin Database:    {'Connected' if AdminDatabase.is_connected() else 'Not configured'}",
+        f"  First Admin Setup: {'Required' if admin_service.is_first_admin() else 'Complete'}",
+        f"  Spoof Detection:   {'Enabled' if Config.SPOOF_DETECTION_ENABLED else 'Disabled'}",
+        f"  Quick Mode:        {'Enabled' if Config.SPOOF_QUICK_MODE else 'Disabled'}",
+        separator,
+        f"  Server starting on http://{Config.HOST}:{Config.PORT}",
+        separator,
+    ])
+    
+    # Emit the banner in one write so it is not interleaved with server logs
+    sys.stdout.write(banner + "\n")
+    sys.stdout.flush()
     
     app.run(host=Config.HOST, port=Config.PORT, debug=Config.DEBUG)
@@ -16,6 +16,19 @@ class Config:
     ENV = os.getenv('FLASK_ENV', 'production')
     HOST = os.getenv('HOST', '0.0.0.0')
     PORT = int(os.getenv('PORT', '5000'))
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'WARNING').upper()
+    
+    # Reject request bodies larger than this before parsing (bytes)
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', str(16 * 1024 * 1024)))
+    
+    # Response compression (applied when Flask-Compress is installed)
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    COMPRESS_BR_LEVEL = int(os.getenv('COMPRESS_BR_LEVEL', '4'))
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))  # gzip
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+    # Flask-Compress buffers a streamed response in full before compressing it,
+    # which would undo the bounded memory of the streamed attendance report
+    COMPRESS_STREAMS = False
     
     # Supabase settings - Main database for users and attendance
     SUPABASE_URL = os.getenv('SUPABASE_URL', '')
@@ -25,6 +38,19 @@ class Config:
     ADMIN_SUPABASE_URL = os.getenv('ADMIN_SUPABASE_URL', '') or os.getenv('SUPABASE_URL', '')
     ADMIN_SUPABASE_KEY = os.getenv('ADMIN_SUPABASE_KEY', '') or os.getenv('SUPABASE_KEY', '')
     
+    # Supabase HTTP connection pool (connections are kept alive between requests)
+    SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', '30'))
+    SUPABASE_CONNECT_TIMEOUT = float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '5'))
+    SUPABASE_CONNECT_RETRIES = int(os.getenv('SUPABASE_CONNECT_RETRIES', '3'))
+    SUPABASE_MAX_CONNECTIONS = int(os.getenv('SUPABASE_MAX_CONNECTIONS', '60'))
+    SUPABASE_MAX_KEEPALIVE = int(os.getenv('SUPABASE_MAX_KEEPALIVE', '40'))
+    SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv('SUPABASE_KEEPALIVE_EXPIRY', '60'))
+    
+    # Retries for transient database connection errors (delays in seconds)
+    DB_MAX_RETRIES = int(os.getenv('DB_MAX_RETRIES', '3'))
+    DB_RETRY_BASE_DELAY = float(os.getenv('DB_RETRY_BASE_DELAY', '0.1'))
+    DB_RETRY_MAX_DELAY = float(os.getenv('DB_RETRY_MAX_DELAY', '2'))
+    
     # Face detection settings
     FACE_DETECTION_MODEL = os.getenv('FACE_DETECTION_MODEL', 'yolo')  # 'yolo', 'hog', or 'cnn'
     
@@ -34,7 +60,21 @@ class Config:
     
     # Face recognition settings
     FACE_RECOGNITION_TOLERANCE = float(os.getenv('FACE_RECOGNITION_TOLERANCE', '0.5'))
-    FACE_NUM_JITTERS = int(os.getenv('FACE_NUM_JITTERS', '1'))
+    # Times each face is re-sampled when encoding: registration can afford
+    # extra passes, identification/verification runs once per face
+    # (FACE_NUM_JITTERS is the older name for the registration setting)
+    FACE_NUM_JITTERS_REGISTER = int(os.getenv('FACE_NUM_JITTERS_REGISTER', os.getenv('FACE_NUM_JITTERS', '1')))
+    FACE_NUM_JITTERS_RECOGNIZE = int(os.getenv('FACE_NUM_JITTERS_RECOGNIZE', '1'))
+    # Landmark model used to align faces before encoding: 'small' (5 points,
+    # face_recognition's default) or 'large' (68 points, slower; opt-in that
+    # requires re-registering every face)
+    FACE_LANDMARK_MODEL = os.getenv('FACE_LANDMARK_MODEL', 'small')
+    # From this many known faces, match through a FAISS index if faiss is
+    # installed, else an int8-quantized shortlist re-checked at full precision
+    FACE_INDEX_MIN_ENCODINGS = int(os.getenv('FACE_INDEX_MIN_ENCODINGS', '5000'))
+    
+    # Set when dlib is known to be built with SIMD (silences the startup warning)
+    DLIB_SIMD_OK = os.getenv('DLIB_SIMD_OK', 'False').lower() == 'true'
     
     # Anti-spoofing settings
     BLINK_THRESHOLD = float(os.getenv('BLINK_THRESHOLD', '0.25'))
@@ -43,26 +83,53 @@ class Config:
     SPOOF_FRAME_COUNT = int(os.getenv('SPOOF_FRAME_COUNT', '5'))
     SPOOF_LAPLACIAN_THRESHOLD = float(os.getenv('SPOOF_LAPLACIAN_THRESHOLD', '50'))
     SPOOF_TEXTURE_THRESHOLD = float(os.getenv('SPOOF_TEXTURE_THRESHOLD', '200'))
+    # Texture confidence on the main image above which spoof frames are not checked
+    SPOOF_FAST_PASS_CONFIDENCE = float(os.getenv('SPOOF_FAST_PASS_CONFIDENCE', '0.6'))
+    # Frames are shrunk by this factor for motion detection
+    SPOOF_ANALYSIS_SCALE = float(os.getenv('SPOOF_ANALYSIS_SCALE', '0.5'))
     
     # Performance settings
     IMAGE_SCALE_FACTOR = float(os.getenv('IMAGE_SCALE_FACTOR', '0.5'))
     MAX_IMAGE_DIMENSION = int(os.getenv('MAX_IMAGE_DIMENSION', '640'))
+    # Edge-preserving denoise before recognition (off: webcam frames are clean enough)
+    DENOISE_ENABLED = os.getenv('DENOISE_ENABLED', 'False').lower() == 'true'
+    # Downscale factor applied while decoding uploaded JPEGs (1, 2, 4 or 8).
+    # Only raise it when clients send frames well above MAX_IMAGE_DIMENSION.
+    IMAGE_DECODE_REDUCTION = int(os.getenv('IMAGE_DECODE_REDUCTION', '1'))
+    # Longest accepted base64 string per image (~6 MB decoded)
+    MAX_IMAGE_B64 = int(os.getenv('MAX_IMAGE_B64', str(8 * 1024 * 1024)))
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', str(min(4, os.cpu_count() or 1))))
     CACHE_ENCODINGS = os.getenv('CACHE_ENCODINGS', 'True').lower() == 'true'
     
+    # Short-lived cache for user/admin lookups by ID
+    LOOKUP_CACHE_SIZE = int(os.getenv('LOOKUP_CACHE_SIZE', '2048'))
+    LOOKUP_CACHE_TTL = float(os.getenv('LOOKUP_CACHE_TTL', '60'))  # seconds
+    REGISTERED_CACHE_TTL = float(os.getenv('REGISTERED_CACHE_TTL', '15'))  # seconds
+    
+    # Upper bound for list endpoint page sizes
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+    
     # Directory settings
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     FACE_ENCODINGS_DIR = os.path.join(BASE_DIR, 'data', 'face_encodings')
     ADMIN_ENCODINGS_DIR = os.path.join(BASE_DIR, 'data', 'admin_encodings')
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'data', 'uploads')
     MODELS_DIR = os.path.join(BASE_DIR, 'models_data')
+    # OpenCV YuNet face detector; the Haar cascades are used when the file is missing
+    YUNET_MODEL_PATH = os.getenv('YUNET_MODEL_PATH', os.path.join(MODELS_DIR, 'face_detection_yunet_2023mar.onnx'))
     
-    # Ensure directories exist
+    _directories_initialized = False
+    
+    # Ensure directories exist (no-op after the first call, e.g. on reload)
     @classmethod
     def init_directories(cls):
-        os.makedirs(cls.FACE_ENCODINGS_DIR, exist_ok=True)
-        os.makedirs(cls.ADMIN_ENCODINGS_DIR, exist_ok=True)
-        os.makedirs(cls.UPLOAD_FOLDER, exist_ok=True)
-        os.makedirs(cls.MODELS_DIR, exist_ok=True)
+        if cls._directories_initialized:
+            return
+        for directory in (cls.FACE_ENCODINGS_DIR, cls.ADMIN_ENCODINGS_DIR,
+                          cls.UPLOAD_FOLDER, cls.MODELS_DIR):
+            if not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+        cls._directories_initialized = True
 
 
 class AdminConfig:
@@ -79,6 +146,12 @@ class AdminConfig:
     
     # Admin face recognition tolerance (stricter than regular)
     ADMIN_RECOGNITION_TOLERANCE = float(os.getenv('ADMIN_RECOGNITION_TOLERANCE', '0.45'))
+    
+    # Activity log rows are written in background batches
+    ACTIVITY_LOG_BATCH_SIZE = int(os.getenv('ACTIVITY_LOG_BATCH_SIZE', '100'))
+    ACTIVITY_LOG_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_LOG_FLUSH_INTERVAL', '1.0'))  # seconds
+    ACTIVITY_LOG_QUEUE_SIZE = int(os.getenv('ACTIVITY_LOG_QUEUE_SIZE', '10000'))
+    ACTIVITY_LOG_MAX_DETAILS_BYTES = int(os.getenv('ACTIVITY_LOG_MAX_DETAILS_BYTES', '8192'))
 
 
 # Initialize directories on import
@@ -2,9 +2,105 @@
 Admin Model
 Handles all admin-related database operations
 """
-from datetime import datetime
+import atexit
+import json
+import logging
+import queue
+import threading
+from datetime import datetime, timezone
 from typing import Optional, Dict, List, Any
-from .database import AdminDatabase
+from cachetools import TTLCache
+from config import Config, AdminConfig
+from .database import AdminDatabase, orjson
+
+logger = logging.getLogger(__name__)
+
+
+def _client():
+    """Get the admin Supabase client (fast path reads the existing singleton)"""
+    return AdminDatabase._instance or AdminDatabase.get_client()
+
+
+def _bounded_details(details: Optional[dict]) -> dict:
+    """Replace activity log details larger than the configured limit with a summary"""
+    if not details:
+        return {}
+    try:
+        if orjson is not None:
+            size = len(orjson.dumps(details, default=str))
+        else:
+            size = len(json.dumps(details, default=str))
+    except (TypeError, ValueError):
+        size = AdminConfig.ACTIVITY_LOG_MAX_DETAILS_BYTES + 1
+    if size <= AdminConfig.ACTIVITY_LOG_MAX_DETAILS_BYTES:
+        return details
+    return {"_truncated": True, "_size": size, "keys": [str(k) for k in list(details)[:50]]}
+
+
+# Recently fetched active admins keyed by admin_id (only hits are cached)
+_admin_cache = TTLCache(maxsize=Config.LOOKUP_CACHE_SIZE, ttl=Config.LOOKUP_CACHE_TTL)
+_admin_cache_lock = threading.Lock()
+
+
+# Activity log rows are buffered here and written in batches by a daemon thread
+_log_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=AdminConfig.ACTIVITY_LOG_QUEUE_SIZE)
+_log_writer: Optional[threading.Thread] = None
+_log_writer_lock = threading.Lock()
+_log_writer_stop = threading.Event()
+
+
+def _drain_log_queue(timeout: float) -> List[Dict[str, Any]]:
+    """Wait up to timeout for one log row, then take whatever else is queued"""
+    batch = []
+    try:
+        batch.append(_log_queue.get(timeout=timeout))
+        while len(batch) < AdminConfig.ACTIVITY_LOG_BATCH_SIZE:
+            batch.append(_log_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+def _write_log_batch(batch: List[Dict[str, Any]]) -> None:
+    """Insert a batch of activity log rows in a single request"""
+    client = _client()
+    if not client or not batch:
+        return
+    try:
+        client.table(AdminModel.LOG_TABLE).insert(batch).execute()
+    except Exception as e:
+        logger.warning("Error logging admin activity: %s", e)
+
+
+def _run_log_writer() -> None:
+    """Background loop flushing queued activity log rows until shutdown"""
+    while not _log_writer_stop.is_set():
+        _write_log_batch(_drain_log_queue(AdminConfig.ACTIVITY_LOG_FLUSH_INTERVAL))
+
+
+def _start_log_writer() -> None:
+    """Start the background log writer once per process"""
+    global _log_writer
+    if _log_writer is not None:
+        return
+    with _log_writer_lock:
+        if _log_writer is None:
+            _log_writer = threading.Thread(target=_run_log_writer, name="admin-log-writer", daemon=True)
+            _log_writer.start()
+
+
+@atexit.register
+def _flush_log_queue() -> None:
+    """Write any activity log rows still queued at interpreter shutdown"""
+    # Let the writer finish the batch it may be sending before draining the rest
+    _log_writer_stop.set()
+    writer = _log_writer
+    if writer is not None:
+        writer.join(timeout=AdminConfig.ACTIVITY_LOG_FLUSH_INTERVAL + Config.SUPABASE_TIMEOUT)
+    batch = _drain_log_queue(timeout=0)
+    while batch:
+        _write_log_batch(batch)
+        batch = _drain_log_queue(timeout=0)
 
 
 class AdminModel:
@@ -13,9 +109,15 @@ class AdminModel:
     TABLE_NAME = "admins"
     LOG_TABLE = "admin_activity_log"
     
-    @classmethod
-    def _get_client(cls):
-        return AdminDatabase.get_client()
+    # Columns shown in the admin list and activity log views
+    ADMIN_COLUMNS = "admin_id,name,email,role,is_active,is_registered"
+    LOG_COLUMNS = "admin_id,action,target_employee_id,details,created_at"
+    
+    @staticmethod
+    def invalidate_cache(admin_id: str) -> None:
+        """Drop a cached admin so the next lookup reads from the database"""
+        with _admin_cache_lock:
+            _admin_cache.pop(admin_id, None)
     
     @classmethod
     def create(cls, admin_id: str, name: str, email: str, 
@@ -32,7 +134,7 @@ class AdminModel:
         Returns:
             Created admin record or None
         """
-        client = cls._get_client()
+        client = _client()
         if not client:
             return None
         
@@ -42,35 +144,76 @@ class AdminModel:
             "email": email,
             "role": role,
             "is_active": True,
-            "is_registered": False,
-            "created_at": datetime.utcnow().isoformat()
+            "is_registered": False
         }
         
         try:
             result = client.table(cls.TABLE_NAME).insert(admin_data).execute()
             return result.data[0] if result.data else None
         except Exception as e:
-            print(f"Error creating admin: {e}")
+            logger.warning("Error creating admin: %s", e)
             return None
+        finally:
+            # After the write, so a concurrent lookup cannot re-cache the old row
+            cls.invalidate_cache(admin_id)
     
     @classmethod
     def get_by_admin_id(cls, admin_id: str) -> Optional[Dict[str, Any]]:
-        """Get admin by admin ID"""
-        client = cls._get_client()
+        """Get admin by admin ID (cached for Config.LOOKUP_CACHE_TTL seconds)"""
+        with _admin_cache_lock:
+            cached = _admin_cache.get(admin_id)
+        if cached is not None:
+            return cached
+        
+        client = _client()
         if not client:
             return None
         
         try:
             result = client.table(cls.TABLE_NAME).select("*").eq("admin_id", admin_id).eq("is_active", True).execute()
-            return result.data[0] if result.data else None
+            admin = result.data[0] if result.data else None
+            if admin is not None:
+                with _admin_cache_lock:
+                    _admin_cache[admin_id] = admin
+            return admin
         except Exception as e:
-            print(f"Error fetching admin: {e}")
+            logger.warning("Error fetching admin: %s", e)
             return None
     
+    @classmethod
+    def get_many_by_ids(cls, admin_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get active admins for several admin IDs in one query, keyed by admin ID
+        
+        Admins already in the lookup cache are served from it.
+        """
+        admins = {}
+        with _admin_cache_lock:
+            for admin_id in admin_ids:
+                cached = _admin_cache.get(admin_id)
+                if cached is not None:
+                    admins[admin_id] = cached
+        
+        missing = [aid for aid in admin_ids if aid not in admins]
+        client = _client()
+        if not client or not missing:
+            return admins
+        
+        try:
+            result = client.table(cls.TABLE_NAME).select(
+                "admin_id,name"
+            ).in_("admin_id", missing).eq("is_active", True).execute()
+            if result.data:
+                admins.update({a['admin_id']: a for a in result.data})
+            return admins
+        except Exception as e:
+            logger.warning("Error fetching admins: %s", e)
+            return admins
+    
     @classmethod
     def get_all(cls) -> List[Dict[str, Any]]:
         """Get all admins"""
-        client = cls._get_client()
+        client = _client()
         if not client:
             return []
         
@@ -78,58 +221,62 @@ class AdminModel:
             result = client.table(cls.TABLE_NAME).select("*").order("created_at", desc=True).execute()
             return result.data if result.data else []
         except Exception as e:
-            print(f"Error fetching admins: {e}")
+            logger.warning("Error fetching admins: %s", e)
             return []
     
     @classmethod
     def get_active_admins(cls) -> List[Dict[str, Any]]:
         """Get all active admins with registered faces"""
-        client = cls._get_client()
+        client = _client()
         if not client:
             return []
         
         try:
-            result = client.table(cls.TABLE_NAME).select("*").eq(
+            result = client.table(cls.TABLE_NAME).select(cls.ADMIN_COLUMNS).eq(
                 "is_active", True
             ).eq("is_registered", True).execute()
             return result.data if result.data else []
         except Exception as e:
-            print(f"Error fetching active admins: {e}")
+            logger.warning("Error fetching active admins: %s", e)
             return []
     
     @classmethod
     def update_registration_status(cls, admin_id: str, is_registered: bool) -> bool:
         """Update admin's face registration status"""
-        client = cls._get_client()
+        client = _client()
         if not client:
             return False
         
         try:
             result = client.table(cls.TABLE_NAME).update({
-                "is_registered": is_registered,
-                "updated_at": datetime.utcnow().isoformat()
+                "is_registered": is_registered
             }).eq("admin_id", admin_id).execute()
             return len(result.data) > 0 if result.data else False
         except Exception as e:
-            print(f"Error updating admin: {e}")
+            logger.warning("Error updating admin: %s", e)
             return False
+        finally:
+            # After the write, so a concurrent lookup cannot re-cache the old row
+            cls.invalidate_cache(admin_id)
     
     @classmethod
     def deactivate(cls, admin_id: str) -> bool:
         """Deactivate an admin (soft delete)"""
-        client = cls._get_client()
+        client = _client()
         if not client:
             return False
         
         try:
             result = client.table(cls.TABLE_NAME).update({
-                "is_active": False,
-                "updated_at": datetime.utcnow().isoformat()
+                "is_active": False
             }).eq("admin_id", admin_id).execute()
             return len(result.data) > 0 if result.data else False
         except Exception as e:
-            print(f"Error deactivating admin: {e}")
+            logger.warning("Error deactivating admin: %s", e)
             return False
+        finally:
+            # After the write, so a concurrent lookup cannot re-cache the old row
+            cls.invalidate_cache(admin_id)
     
     @classmethod
     def log_activity(cls, admin_id: str, action: str, 
@@ -137,16 +284,20 @@ class AdminModel:
         """
         Log admin activity
         
+        The row is queued and written by a background thread in batches,
+        so this does not wait on the database.
+        
         Args:
             admin_id: Admin who performed the action
             action: Action type (e.g., 'user_registration', 'user_deletion')
             target_employee_id: Employee affected by the action
-            details: Additional details as JSON
+            details: Additional details as JSON (summarized if over
+                AdminConfig.ACTIVITY_LOG_MAX_DETAILS_BYTES)
         
         Returns:
-            Success status
+            True if the entry was queued (False if the queue is full)
         """
-        client = cls._get_client()
+        client = _client()
         if not client:
             return False
         
@@ -154,46 +305,60 @@ class AdminModel:
             "admin_id": admin_id,
             "action": action,
             "target_employee_id": target_employee_id,
-            "details": details or {},
-            "created_at": datetime.utcnow().isoformat()
+            "details": _bounded_details(details),
+            # Stamped here rather than by the DB: rows are written in delayed batches
+            "created_at": datetime.now(timezone.utc).isoformat()
         }
         
+        _start_log_writer()
         try:
-            client.table(cls.LOG_TABLE).insert(log_data).execute()
-            return True
-        except Exception as e:
-            print(f"Error logging admin activity: {e}")
+            _log_queue.put_nowait(log_data)
+        except queue.Full:
+            logger.warning("Activity log queue full, dropping %s entry", action)
             return False
+        return True
     
     @classmethod
-    def get_activity_log(cls, admin_id: str = None, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get admin activity log"""
-        client = cls._get_client()
+    def get_activity_log(cls, admin_id: str = None, limit: int = 50,
+                         before: str = None) -> List[Dict[str, Any]]:
+        """
+        Get admin activity log, newest first
+        
+        Args:
+            admin_id: Only return entries for this admin
+            limit: Maximum number of entries
+            before: Keyset cursor - only entries created before this timestamp
+        """
+        client = _client()
         if not client:
             return []
         
         try:
-            query = client.table(cls.LOG_TABLE).select("*")
+            query = client.table(cls.LOG_TABLE).select(cls.LOG_COLUMNS)
             if admin_id:
                 query = query.eq("admin_id", admin_id)
+            if before:
+                query = query.lt("created_at", before)
             result = query.order("created_at", desc=True).limit(limit).execute()
             return result.data if result.data else []
         except Exception as e:
-            print(f"Error fetching activity log: {e}")
+            logger.warning("Error fetching activity log: %s", e)
             return []
     
     @classmethod
     def has_any_registered_admin(cls) -> bool:
         """Check if there's at least one registered admin"""
-        client = cls._get_client()
+        client = _client()
         if not client:
             return False
         
         try:
-            result = client.table(cls.TABLE_NAME).select("id").eq(
-                "is_registered", True
-            ).eq("is_active", True).limit(1).execute()
-            return len(result.data) > 0 if result.data else False
+            # GET for at most one row; postgrest 0.13 reports count=0 for HEAD requests
+            result = client.table(cls.TABLE_NAME).select(
+                "id", count="exact"
+            ).eq("is_registered", True).eq("is_active", True).limit(1).execute()
+            return bool(result.data) or (result.count or 0) > 0
         except Exception as e:
-            print(f"Error checking for registered admins: {e}")
-            return False
+            # Fail closed: an unanswered check must not reopen first-admin setup
+            logger.warning("Error checking for registered admins: %s", e)
+            return True
@@ -2,9 +2,36 @@
 Attendance Model
 Handles all attendance-related database operations
 """
-from datetime import datetime, date
-from typing import Optional, Dict, List, Any
-from .database import Database
+import logging
+from datetime import datetime, date, timezone
+from typing import Optional, Dict, List, Any, Iterator
+from flask import g, has_request_context
+from .database import (
+    Database, is_connection_error, is_missing_function_error, is_missing_relationship_error
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _client():
+    """Get the main Supabase client (fast path reads the existing singleton)"""
+    return Database._instance or Database.get_client()
+
+
+def _today_iso() -> str:
+    """Today's date as YYYY-MM-DD, computed once per request"""
+    if not has_request_context():
+        return date.today().isoformat()
+    today = getattr(g, '_today_iso', None)
+    if today is None:
+        today = g._today_iso = date.today().isoformat()
+    return today
+
+
+def _parse_utc(timestamp: str) -> datetime:
+    """Parse an ISO timestamp returned by Supabase as an aware UTC datetime"""
+    parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
 
 
 class AttendanceModel:
@@ -12,9 +39,27 @@ class AttendanceModel:
     
     TABLE_NAME = "attendance"
     
-    @classmethod
-    def _get_client(cls):
-        return Database.get_client()
+    # Columns returned by listing endpoints (history, today, report)
+    RECORD_COLUMNS = "id,employee_id,date,punch_in,punch_out,hours_worked"
+    # Same, with the user's name/department embedded through the users FK
+    # (a left join, so admin records are still returned)
+    ENRICHED_COLUMNS = RECORD_COLUMNS + ",users(name,department)"
+    _user_embed_available = True
+    
+    # Rows fetched per request when paging through reports
+    REPORT_PAGE_SIZE = 1000
+    # Columns needed to aggregate statistics
+    STATS_COLUMNS = "date,punch_out,hours_worked"
+    
+    # Postgres error code raised when UNIQUE(employee_id, date) is violated
+    UNIQUE_VIOLATION = "23505"
+    
+    # Postgres function aggregating statistics (see CREATE_TABLES_SQL)
+    STATS_RPC = "attendance_stats"
+    _stats_rpc_available = True
+    # Postgres function closing today's record and returning the user's name
+    PUNCH_OUT_RPC = "attendance_punch_out"
+    _punch_out_rpc_available = True
     
     @classmethod
     def record_punch_in(cls, employee_id: str, confidence: float = None) -> Dict[str, Any]:
@@ -28,30 +73,28 @@ class AttendanceModel:
         Returns:
             Attendance record or error
         """
-        client = cls._get_client()
+        client = _client()
         if not client:
             return {"error": "Database not connected"}
         
-        today = date.today().isoformat()
-        now = datetime.utcnow()
-        
-        # Check if already punched in today
-        existing = cls.get_today_record(employee_id)
-        if existing and existing.get('punch_in'):
-            return {"error": "Already punched in today", "record": existing}
+        today = _today_iso()
         
         attendance_data = {
             "employee_id": employee_id,
             "date": today,
-            "punch_in": now.isoformat(),
-            "created_at": now.isoformat()
+            "punch_in": datetime.now(timezone.utc).isoformat()
         }
         
+        # Insert directly and let UNIQUE(employee_id, date) reject a second
+        # punch-in, so the common path is a single round-trip
         try:
             result = client.table(cls.TABLE_NAME).insert(attendance_data).execute()
             return result.data[0] if result.data else {"error": "Failed to record"}
         except Exception as e:
-            print(f"Error recording punch-in: {e}")
+            if getattr(e, 'code', None) == cls.UNIQUE_VIOLATION:
+                existing = cls.get_today_record(employee_id)
+                return {"error": "Already punched in today", "record": existing}
+            logger.warning("Error recording punch-in: %s", e)
             return {"error": str(e)}
     
     @classmethod
@@ -64,13 +107,29 @@ class AttendanceModel:
             confidence: Face recognition confidence score
         
         Returns:
-            Updated attendance record or error
+            Updated attendance record or error; when the attendance_punch_out
+            function is installed the record also carries the user's
+            'name' and 'department'
         """
-        client = cls._get_client()
+        client = _client()
         if not client:
             return {"error": "Database not connected"}
         
-        now = datetime.utcnow()
+        if cls._punch_out_rpc_available:
+            try:
+                result = client.rpc(cls.PUNCH_OUT_RPC, {
+                    "p_emp": employee_id,
+                    "p_date": _today_iso()
+                }).execute()
+                return result.data or {"error": "Failed to update"}
+            except Exception as e:
+                if not is_missing_function_error(e):
+                    logger.warning("Error recording punch-out: %s", e)
+                    return {"error": str(e)}
+                logger.warning("Punch-out RPC unavailable, updating the row instead: %s", e)
+                cls._punch_out_rpc_available = False
+        
+        now = datetime.now(timezone.utc)
         
         # Check if punched in today
         existing = cls.get_today_record(employee_id)
@@ -80,21 +139,17 @@ class AttendanceModel:
             return {"error": "Already punched out today", "record": existing}
         
         # Calculate hours worked
-        punch_in_str = existing['punch_in']
-        if punch_in_str.endswith('Z'):
-            punch_in_str = punch_in_str[:-1] + '+00:00'
-        punch_in_time = datetime.fromisoformat(punch_in_str)
-        hours_worked = (now - punch_in_time.replace(tzinfo=None)).total_seconds() / 3600
+        hours_worked = round((now - _parse_utc(existing['punch_in'])).total_seconds() / 3600, 2)
         
         try:
             result = client.table(cls.TABLE_NAME).update({
                 "punch_out": now.isoformat(),
-                "hours_worked": round(hours_worked, 2)
+                "hours_worked": hours_worked
             }).eq("id", existing['id']).execute()
             
             return result.data[0] if result.data else {"error": "Failed to update"}
         except Exception as e:
-            print(f"Error recording punch-out: {e}")
+            logger.warning("Error recording punch-out: %s", e)
             return {"error": str(e)}
     
     @classmethod
@@ -112,11 +167,11 @@ class AttendanceModel:
         Returns:
             Updated attendance record, discarded status, or error
         """
-        client = cls._get_client()
+        client = _client()
         if not client:
             return {"error": "Database not connected"}
         
-        now = datetime.utcnow()
+        now = datetime.now(timezone.utc)
         
         # Check if punched in today
         existing = cls.get_today_record(employee_id)
@@ -126,11 +181,7 @@ class AttendanceModel:
             return {"error": "Already punched out today", "record": existing}
         
         # Calculate time difference
-        punch_in_str = existing['punch_in']
-        if punch_in_str.endswith('Z'):
-            punch_in_str = punch_in_str[:-1] + '+00:00'
-        punch_in_time = datetime.fromisoformat(punch_in_str)
-        duration_seconds = (now - punch_in_time.replace(tzinfo=None)).total_seconds()
+        duration_seconds = (now - _parse_utc(existing['punch_in'])).total_seconds()
         
         # Check if within minimum duration (10-20 seconds as per requirement)
         if duration_seconds < min_duration_seconds:
@@ -143,157 +194,267 @@ class AttendanceModel:
                     "message": f"Attendance discarded - duration was only {duration_seconds:.0f} seconds"
                 }
             except Exception as e:
-                print(f"Error discarding attendance: {e}")
+                logger.warning("Error discarding attendance: %s", e)
                 return {"error": f"Failed to discard: {str(e)}"}
         
         # Calculate hours worked
-        hours_worked = duration_seconds / 3600
+        hours_worked = round(duration_seconds / 3600, 2)
         
         try:
             result = client.table(cls.TABLE_NAME).update({
                 "punch_out": now.isoformat(),
-                "hours_worked": round(hours_worked, 2)
+                "hours_worked": hours_worked
             }).eq("id", existing['id']).execute()
             
-            if result.data:
-                result_data = result.data[0]
-                result_data['hours_worked'] = round(hours_worked, 2)
-                return result_data
-            return {"error": "Failed to update"}
+            return result.data[0] if result.data else {"error": "Failed to update"}
         except Exception as e:
-            print(f"Error recording punch-out: {e}")
+            logger.warning("Error recording punch-out: %s", e)
             return {"error": str(e)}
     
     @classmethod
     def get_today_record(cls, employee_id: str) -> Optional[Dict[str, Any]]:
         """Get today's attendance record for an employee"""
-        client = cls._get_client()
+        client = _client()
         if not client:
             return None
         
-        today = date.today().isoformat()
+        today = _today_iso()
         
         try:
-            result = client.table(cls.TABLE_NAME).select("*").eq(
+            result = client.table(cls.TABLE_NAME).select(cls.RECORD_COLUMNS).eq(
                 "employee_id", employee_id
-            ).eq("date", today).execute()
-            return result.data[0] if result.data else None
+            ).eq("date", today).limit(1).maybe_single().execute()
+            # Some postgrest versions return None instead of an empty response
+            return result.data if result else None
         except Exception as e:
-            print(f"Error fetching today's record: {e}")
+            logger.warning("Error fetching today's record: %s", e)
             return None
     
     @classmethod
     def get_history(cls, employee_id: str, limit: int = 30) -> List[Dict[str, Any]]:
         """Get attendance history for an employee"""
-        client = cls._get_client()
+        client = _client()
         if not client:
             return []
         
         try:
-            result = client.table(cls.TABLE_NAME).select("*").eq(
+            result = client.table(cls.TABLE_NAME).select(cls.RECORD_COLUMNS).eq(
                 "employee_id", employee_id
             ).order("date", desc=True).limit(limit).execute()
             return result.data if result.data else []
         except Exception as e:
-            print(f"Error fetching history: {e}")
+            logger.warning("Error fetching history: %s", e)
             return []
     
+    @staticmethod
+    def _enrich_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Attach name/department to attendance records
+        
+        Users embedded by ENRICHED_COLUMNS are used directly; other users
+        and admins are fetched with one bulk query each instead of one
+        lookup per record.
+        """
+        if not records:
+            return records
+        
+        from models import UserModel, AdminModel
+        employee_ids = list({r.get('employee_id') for r in records if r.get('employee_id')})
+        
+        user_map = {}
+        embedded_ids = set()
+        for record in records:
+            if 'users' in record:
+                embedded_ids.add(record.get('employee_id'))
+                user = record.pop('users')
+                if user:
+                    user_map[record.get('employee_id')] = user
+        
+        user_map.update(UserModel.get_many_by_ids([eid for eid in employee_ids if eid not in embedded_ids]))
+        
+        # Only look up admins for IDs that are not regular users
+        admin_ids = [eid for eid in employee_ids if eid not in user_map]
+        admin_map = AdminModel.get_many_by_ids(admin_ids)
+        
+        for record in records:
+            employee_id = record.get('employee_id')
+            user = user_map.get(employee_id)
+            if user:
+                record['name'] = user.get('name', employee_id)
+                record['department'] = user.get('department', '-')
+            else:
+                admin = admin_map.get(employee_id)
+                if admin:
+                    record['name'] = admin.get('name', employee_id)
+                    record['department'] = 'Admin'
+                else:
+                    record['name'] = employee_id
+                    record['department'] = '-'
+        
+        return records
+    
+    @classmethod
+    def _fetch_records(cls, build_query) -> List[Dict[str, Any]]:
+        """
+        Run build_query(columns) with user details embedded when possible
+        
+        Falls back to the plain columns (and stops embedding) if PostgREST
+        cannot resolve the users relationship.
+        """
+        if cls._user_embed_available:
+            try:
+                return build_query(cls.ENRICHED_COLUMNS).execute().data or []
+            except Exception as e:
+                if not is_missing_relationship_error(e):
+                    raise
+                logger.warning("User embedding unavailable, fetching users separately: %s", e)
+                cls._user_embed_available = False
+        return build_query(cls.RECORD_COLUMNS).execute().data or []
+    
     @classmethod
     def get_all_today(cls) -> List[Dict[str, Any]]:
         """Get all attendance records for today"""
-        client = cls._get_client()
+        client = _client()
         if not client:
             return []
         
-        today = date.today().isoformat()
+        today = _today_iso()
         
         try:
-            # First get all attendance records without join (to include admins)
-            result = client.table(cls.TABLE_NAME).select("*").eq(
-                "date", today
-            ).order("punch_in", desc=True).execute()
-            
-            records = result.data if result.data else []
+            records = cls._fetch_records(lambda columns: client.table(cls.TABLE_NAME).select(
+                columns
+            ).eq("date", today).order("punch_in", desc=True))
             
             # Enrich with user/admin info
-            from models import UserModel, AdminModel
-            for record in records:
-                employee_id = record.get('employee_id')
-                user = UserModel.get_by_employee_id(employee_id)
-                if user:
-                    record['name'] = user.get('name', employee_id)
-                    record['department'] = user.get('department', '-')
-                else:
-                    # Check if admin
-                    admin = AdminModel.get_by_admin_id(employee_id)
-                    if admin:
-                        record['name'] = admin.get('name', employee_id)
-                        record['department'] = 'Admin'
-                    else:
-                        record['name'] = employee_id
-                        record['department'] = '-'
-            
-            return records
+            return cls._enrich_records(records)
         except Exception as e:
-            print(f"Error fetching today's records: {e}")
+            logger.warning("Error fetching today's records: %s", e)
             return []
     
     @classmethod
-    def get_report(cls, start_date: str, end_date: str, 
-                   employee_id: str = None) -> List[Dict[str, Any]]:
-        """Get attendance report for a date range"""
-        client = cls._get_client()
+    def iter_report(cls, start_date: str, end_date: str,
+                    employee_id: str = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield attendance report records for a date range, one enriched page
+        (REPORT_PAGE_SIZE rows) at a time, newest first
+        """
+        client = _client()
         if not client:
-            return []
+            return
         
-        try:
-            query = client.table(cls.TABLE_NAME).select("*").gte(
-                "date", start_date
-            ).lte("date", end_date)
-            
-            if employee_id:
-                query = query.eq("employee_id", employee_id)
+        offset = 0
+        while True:
+            def build_query(columns, offset=offset):
+                query = client.table(cls.TABLE_NAME).select(columns).gte(
+                    "date", start_date
+                ).lte("date", end_date)
+                
+                if employee_id:
+                    query = query.eq("employee_id", employee_id)
+                
+                # id breaks ties so pages don't overlap
+                return query.order("date", desc=True).order("id", desc=True).range(
+                    offset, offset + cls.REPORT_PAGE_SIZE - 1
+                )
             
-            result = query.order("date", desc=True).execute()
-            records = result.data if result.data else []
+            records = cls._fetch_records(build_query)
+            if not records:
+                return
             
             # Enrich with user/admin info
-            from models import UserModel, AdminModel
-            for record in records:
-                emp_id = record.get('employee_id')
-                user = UserModel.get_by_employee_id(emp_id)
-                if user:
-                    record['name'] = user.get('name', emp_id)
-                    record['department'] = user.get('department', '-')
-                else:
-                    admin = AdminModel.get_by_admin_id(emp_id)
-                    if admin:
-                        record['name'] = admin.get('name', emp_id)
-                        record['department'] = 'Admin'
-                    else:
-                        record['name'] = emp_id
-                        record['department'] = '-'
+            yield cls._enrich_records(records)
             
-            return records
+            if len(records) < cls.REPORT_PAGE_SIZE:
+                return
+            offset += cls.REPORT_PAGE_SIZE
+    
+    @classmethod
+    def get_report(cls, start_date: str, end_date: str, 
+                   employee_id: str = None) -> List[Dict[str, Any]]:
+        """Get attendance report for a date range"""
+        try:
+            return [record for page in cls.iter_report(start_date, end_date, employee_id)
+                    for record in page]
         except Exception as e:
-            print(f"Error fetching report: {e}")
+            logger.warning("Error fetching report: %s", e)
             return []
     
+    @staticmethod
+    def _format_statistics(total_days: int, complete_days: int, total_hours: float,
+                           present_today: int, completed_today: int) -> Dict[str, Any]:
+        """Build the statistics payload from raw aggregates"""
+        return {
+            "total_days": total_days,
+            "complete_days": complete_days,
+            "total_hours": round(total_hours, 2),
+            "average_hours": round(total_hours / complete_days, 2) if complete_days > 0 else 0,
+            "present_today": present_today,
+            "completed_today": completed_today
+        }
+    
+    @classmethod
+    def _get_statistics_rpc(cls, client, employee_id: Optional[str], start_date: str,
+                            end_date: str, today: str) -> Optional[Dict[str, Any]]:
+        """
+        Aggregate statistics in Postgres via the attendance_stats function
+        
+        Returns None if the call fails so the caller can fall back to
+        aggregating rows, and stops trying if the function is not installed.
+        Connection errors are raised, since the fallback would fail the same way.
+        """
+        if not cls._stats_rpc_available:
+            return None
+        
+        try:
+            result = client.rpc(cls.STATS_RPC, {
+                "p_emp": employee_id,
+                "p_start": start_date,
+                "p_end": end_date,
+                "p_today": today
+            }).execute()
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            logger.warning("Statistics RPC failed, aggregating rows instead: %s", e)
+            if is_missing_function_error(e):
+                cls._stats_rpc_available = False
+            return None
+        
+        stats = result.data or {}
+        return cls._format_statistics(
+            stats.get('total_days', 0),
+            stats.get('complete_days', 0),
+            stats.get('total_hours', 0) or 0,
+            stats.get('present_today', 0),
+            stats.get('completed_today', 0)
+        )
+    
     @classmethod
     def get_statistics(cls, employee_id: str = None, days: int = 30) -> Dict[str, Any]:
         """Get attendance statistics"""
-        client = cls._get_client()
+        client = _client()
         if not client:
             return {}
         
         from datetime import timedelta
-        end_date = date.today()
+        today = _today_iso()
+        end_date = date.fromisoformat(today)
         start_date = end_date - timedelta(days=days)
-        today = date.today().isoformat()
+        
+        # Preferred path: only the aggregates cross the wire
+        try:
+            stats = cls._get_statistics_rpc(
+                client, employee_id, start_date.isoformat(), end_date.isoformat(), today
+            )
+        except Exception as e:
+            logger.warning("Error calculating statistics: %s", e)
+            return {}
+        if stats is not None:
+            return stats
         
         try:
             # Get records for the period
-            query = client.table(cls.TABLE_NAME).select("*").gte(
+            query = client.table(cls.TABLE_NAME).select(cls.STATS_COLUMNS).gte(
                 "date", start_date.isoformat()
             ).lte("date", end_date.isoformat())
             
@@ -303,27 +464,30 @@ class AttendanceModel:
             result = query.execute()
             records = result.data if result.data else []
             
-            # Get today's records separately
-            today_result = client.table(cls.TABLE_NAME).select("*").eq("date", today).execute()
-            today_records = today_result.data if today_result.data else []
+            # Today is inside the range, so reuse the same rows unless the range
+            # was narrowed to one employee (today's stats cover everyone)
+            if employee_id:
+                today_result = client.table(cls.TABLE_NAME).select(cls.STATS_COLUMNS).eq("date", today).execute()
+                today_records = today_result.data if today_result.data else []
+            else:
+                today_records = [r for r in records if r.get('date') == today]
             
             # Calculate statistics
-            total_days = len(records)
-            total_hours = sum(r.get('hours_worked', 0) or 0 for r in records)
-            complete_days = sum(1 for r in records if r.get('punch_out'))
+            # Single pass over the rows for both aggregates
+            total_hours = 0.0
+            complete_days = 0
+            for r in records:
+                total_hours += r.get('hours_worked') or 0
+                if r.get('punch_out'):
+                    complete_days += 1
             
             # Today's stats
             present_today = len(today_records)  # Anyone who punched in today
             completed_today = sum(1 for r in today_records if r.get('punch_out'))
             
-            return {
-                "total_days": total_days,
-                "complete_days": complete_days,
-                "total_hours": round(total_hours, 2),
-                "average_hours": round(total_hours / complete_days, 2) if complete_days > 0 else 0,
-                "present_today": present_today,
-                "completed_today": completed_today
-            }
+            return cls._format_statistics(
+                len(records), complete_days, total_hours, present_today, completed_today
+            )
         except Exception as e:
-            print(f"Error calculating statistics: {e}")
+            logger.warning("Error calculating statistics: %s", e)
             return {}
@@ -2,57 +2,260 @@
 Database Connection Module
 Handles Supabase connections for main and admin databases
 """
+import atexit
+import logging
+import random
+import threading
+import time
+import httpx
 from supabase import create_client, Client
-from typing import Optional
+from typing import Optional, Callable, TypeVar
 from config import Config
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+class _OrjsonResponse:
+    """httpx.Response proxy whose json() decodes with orjson"""
+    
+    def __init__(self, response):
+        self._response = response
+    
+    def json(self, **kwargs):
+        return orjson.loads(self._response.content)
+    
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+def _install_orjson_decoder() -> None:
+    """Make PostgREST decode response bodies with orjson when it is installed"""
+    if orjson is None:
+        return
+    try:
+        from postgrest.base_request_builder import APIResponse
+    except ImportError:
+        return
+    
+    original = getattr(APIResponse, 'from_http_request_response', None)
+    if original is None or getattr(original, '_uses_orjson', False):
+        return
+    
+    def from_http_request_response(cls, request_response):
+        return original.__func__(cls, _OrjsonResponse(request_response))
+    
+    from_http_request_response._uses_orjson = True
+    APIResponse.from_http_request_response = classmethod(from_http_request_response)
+
+
+_install_orjson_decoder()
+
+
+def _configure_connection_pool(client: Client) -> None:
+    """
+    Replace the PostgREST HTTP session with a tuned keep-alive pool
+    
+    Connections (and their TLS sessions) are reused across requests, failed
+    connection attempts are retried by the transport, and HTTP/2 is used
+    when the optional h2 package is installed.
+    """
+    try:
+        from importlib.util import find_spec
+        
+        postgrest = client.postgrest
+        session = postgrest.session
+        transport = httpx.HTTPTransport(
+            http2=find_spec('h2') is not None,
+            retries=Config.SUPABASE_CONNECT_RETRIES,
+            limits=httpx.Limits(
+                max_connections=Config.SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.SUPABASE_MAX_KEEPALIVE,
+                keepalive_expiry=Config.SUPABASE_KEEPALIVE_EXPIRY
+            )
+        )
+        postgrest.session = httpx.Client(
+            base_url=session.base_url,
+            headers=session.headers,
+            timeout=httpx.Timeout(Config.SUPABASE_TIMEOUT, connect=Config.SUPABASE_CONNECT_TIMEOUT),
+            transport=transport
+        )
+        session.close()
+    except Exception as e:
+        logger.warning("Could not configure Supabase connection pool: %s", e)
+
+
+def _close_client(client: Client) -> None:
+    """Close the HTTP connection pool behind a Supabase client"""
+    try:
+        client.postgrest.session.close()
+    except Exception as e:
+        logger.warning("Error closing Supabase connection pool: %s", e)
+
+
+def _create_client(url: str, key: str) -> Client:
+    """Create a Supabase client backed by a persistent connection pool"""
+    client = create_client(url, key)
+    _configure_connection_pool(client)
+    return client
+
 
 class Database:
     """Main database connection for users and attendance"""
     
     _instance: Optional[Client] = None
+    _lock = threading.Lock()
     
     @classmethod
     def get_client(cls) -> Optional[Client]:
-        """Get or create Supabase client singleton"""
-        if cls._instance is None:
-            if not Config.SUPABASE_URL or not Config.SUPABASE_KEY:
-                return None
-            try:
-                cls._instance = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
-            except Exception as e:
-                print(f"Failed to connect to main database: {e}")
-                return None
+        """Get or create Supabase client singleton (thread-safe lazy init)"""
+        if cls._instance is not None:
+            return cls._instance
+        if not Config.SUPABASE_URL or not Config.SUPABASE_KEY:
+            return None
+        with cls._lock:
+            # Re-check: another thread may have connected while we waited
+            if cls._instance is None:
+                try:
+                    cls._instance = _create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+                except Exception as e:
+                    logger.warning("Failed to connect to main database: %s", e)
+                    return None
         return cls._instance
     
     @classmethod
     def is_connected(cls) -> bool:
         """Check if database is connected"""
         return cls.get_client() is not None
+    
+    @classmethod
+    def disconnect(cls) -> None:
+        """Close the connection pool and drop the client singleton"""
+        with cls._lock:
+            if cls._instance is not None:
+                _close_client(cls._instance)
+                cls._instance = None
+    
+    @classmethod
+    def reset(cls, failed: Optional[Client]) -> None:
+        """
+        Drop a client whose connections look broken so the next call reconnects
+        
+        The old pool is not closed: other threads may still be mid-request on
+        it, and its connections are released once they are done with it. A
+        client that has already been replaced is left alone.
+        """
+        with cls._lock:
+            if failed is not None and cls._instance is failed:
+                cls._instance = None
 
 
 class AdminDatabase:
     """Separate database connection for admin data"""
     
     _instance: Optional[Client] = None
+    _lock = threading.Lock()
     
     @classmethod
     def get_client(cls) -> Optional[Client]:
-        """Get or create Admin Supabase client singleton"""
-        if cls._instance is None:
-            if not Config.ADMIN_SUPABASE_URL or not Config.ADMIN_SUPABASE_KEY:
-                return None
-            try:
-                cls._instance = create_client(Config.ADMIN_SUPABASE_URL, Config.ADMIN_SUPABASE_KEY)
-            except Exception as e:
-                print(f"Failed to connect to admin database: {e}")
-                return None
+        """Get or create Admin Supabase client singleton (thread-safe lazy init)"""
+        if cls._instance is not None:
+            return cls._instance
+        if not Config.ADMIN_SUPABASE_URL or not Config.ADMIN_SUPABASE_KEY:
+            return None
+        with cls._lock:
+            # Re-check: another thread may have connected while we waited
+            if cls._instance is None:
+                try:
+                    cls._instance = _create_client(Config.ADMIN_SUPABASE_URL, Config.ADMIN_SUPABASE_KEY)
+                except Exception as e:
+                    logger.warning("Failed to connect to admin database: %s", e)
+                    return None
         return cls._instance
     
     @classmethod
     def is_connected(cls) -> bool:
         """Check if admin database is connected"""
         return cls.get_client() is not None
+    
+    @classmethod
+    def disconnect(cls) -> None:
+        """Close the connection pool and drop the client singleton"""
+        with cls._lock:
+            if cls._instance is not None:
+                _close_client(cls._instance)
+                cls._instance = None
+    
+    @classmethod
+    def reset(cls, failed: Optional[Client]) -> None:
+        """
+        Drop a client whose connections look broken so the next call reconnects
+        
+        The old pool is not closed: other threads may still be mid-request on
+        it, and its connections are released once they are done with it. A
+        client that has already been replaced is left alone.
+        """
+        with cls._lock:
+            if failed is not None and cls._instance is failed:
+                cls._instance = None
+
+
+# PostgREST "function not found in schema cache" and Postgres undefined_function
+_MISSING_FUNCTION_CODES = ("PGRST202", "42883")
+
+
+def is_connection_error(error: Exception) -> bool:
+    """Whether an error is a transient transport failure worth retrying"""
+    return isinstance(error, httpx.TransportError)
+
+
+def is_missing_function_error(error: Exception) -> bool:
+    """Whether an RPC failed because the database function is not installed"""
+    return getattr(error, 'code', None) in _MISSING_FUNCTION_CODES
+
+
+def is_missing_relationship_error(error: Exception) -> bool:
+    """Whether PostgREST could not resolve an embedded resource (no foreign key between the tables)"""
+    return getattr(error, 'code', None) == "PGRST200"
+
+
+def _needs_reconnect(error: Exception) -> bool:
+    """Whether the pooled connections are likely broken (not just slow)"""
+    return isinstance(error, (httpx.ConnectError, httpx.RemoteProtocolError))
+
+
+def retry_db_operation(operation: Callable[[], T], database=Database) -> T:
+    """
+    Run a database operation, retrying transient connection failures
+    
+    Retries use jittered exponential backoff (Config.DB_RETRY_*). When the
+    connection itself looks broken the client is replaced (without closing
+    it under other threads) so the next attempt reconnects; operation should
+    therefore fetch the client on each call.
+    Non-transport errors are raised immediately.
+    """
+    for attempt in range(Config.DB_MAX_RETRIES + 1):
+        client = database._instance
+        try:
+            return operation()
+        except Exception as e:
+            if attempt >= Config.DB_MAX_RETRIES or not is_connection_error(e):
+                raise
+            if _needs_reconnect(e):
+                database.reset(client)
+            delay = min(Config.DB_RETRY_MAX_DELAY, Config.DB_RETRY_BASE_DELAY * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+
+# Release pooled connections when the worker process exits
+atexit.register(Database.disconnect)
+atexit.register(AdminDatabase.disconnect)
 
 
 # SQL to create tables in Supabase (run this in Supabase SQL Editor)
@@ -77,7 +280,7 @@ CREATE TABLE IF NOT EXISTS users (
 -- Attendance table
 CREATE TABLE IF NOT EXISTS attendance (
     id SERIAL PRIMARY KEY,
-    employee_id VARCHAR(50) NOT NULL REFERENCES users(employee_id),
+    employee_id VARCHAR(50) NOT NULL REFERENCES users(employee_id) ON DELETE CASCADE,
     date DATE NOT NULL,
     punch_in TIMESTAMP WITH TIME ZONE,
     punch_out TIMESTAMP WITH TIME ZONE,
@@ -89,10 +292,90 @@ CREATE TABLE IF NOT EXISTS attendance (
     UNIQUE(employee_id, date)
 );
 
+-- Existing databases: make user deletion cascade to attendance
+-- ALTER TABLE attendance DROP CONSTRAINT IF EXISTS attendance_employee_id_fkey;
+-- ALTER TABLE attendance ADD CONSTRAINT attendance_employee_id_fkey
+--     FOREIGN KEY (employee_id) REFERENCES users(employee_id) ON DELETE CASCADE;
+
 -- Indexes
-CREATE INDEX IF NOT EXISTS idx_attendance_employee_id ON attendance(employee_id);
+-- UNIQUE(employee_id, date) backs the one-row punch lookups; the covering
+-- (employee_id, date DESC) index serves per-employee history and ranged
+-- reports with index-only scans; idx_attendance_date backs date-range reports
+CREATE INDEX IF NOT EXISTS idx_attendance_emp_date ON attendance(employee_id, date DESC)
+    INCLUDE (punch_in, punch_out, hours_worked);
 CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date);
 CREATE INDEX IF NOT EXISTS idx_users_employee_id ON users(employee_id);
+CREATE INDEX IF NOT EXISTS idx_users_registered ON users(employee_id) WHERE is_registered = true;
+
+-- Trigram indexes let UserModel.search's '%query%' ILIKE use an index
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_users_name_trgm ON users USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_employee_id_trgm ON users USING GIN (employee_id gin_trgm_ops);
+
+-- Timestamps are set by the database: created_at via DEFAULT NOW(),
+-- updated_at via this trigger
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_updated ON users;
+CREATE TRIGGER trg_users_updated BEFORE UPDATE ON users
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+DROP TRIGGER IF EXISTS trg_attendance_updated ON attendance;
+CREATE TRIGGER trg_attendance_updated BEFORE UPDATE ON attendance
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Attendance statistics aggregated in the database (AttendanceModel.get_statistics)
+-- Today's counts cover all employees, matching the dashboard
+CREATE OR REPLACE FUNCTION attendance_stats(p_emp TEXT, p_start DATE, p_end DATE, p_today DATE)
+RETURNS JSON LANGUAGE SQL STABLE AS $$
+    SELECT json_build_object(
+        'total_days', count(*),
+        'complete_days', count(*) FILTER (WHERE punch_out IS NOT NULL),
+        'total_hours', COALESCE(sum(hours_worked), 0),
+        'present_today', (SELECT count(*) FROM attendance WHERE date = p_today),
+        'completed_today', (SELECT count(*) FROM attendance
+                            WHERE date = p_today AND punch_out IS NOT NULL)
+    )
+    FROM attendance
+    WHERE date BETWEEN p_start AND p_end
+      AND (p_emp IS NULL OR employee_id = p_emp);
+$$;
+
+-- Punch-out in one round-trip (AttendanceModel.record_punch_out): closes
+-- today's open record and returns it with the user's name and department
+CREATE OR REPLACE FUNCTION attendance_punch_out(p_emp TEXT, p_date DATE)
+RETURNS JSONB LANGUAGE plpgsql AS $$
+DECLARE
+    rec JSONB;
+BEGIN
+    WITH updated AS (
+        UPDATE attendance
+           SET punch_out = NOW(),
+               hours_worked = ROUND((EXTRACT(EPOCH FROM NOW() - punch_in) / 3600)::numeric, 2)
+         WHERE employee_id = p_emp AND date = p_date
+           AND punch_in IS NOT NULL AND punch_out IS NULL
+        RETURNING id, employee_id, date, punch_in, punch_out, hours_worked
+    )
+    SELECT to_jsonb(u) || jsonb_build_object('name', users.name, 'department', users.department)
+      INTO rec
+      FROM updated u LEFT JOIN users ON users.employee_id = u.employee_id;
+    IF rec IS NOT NULL THEN
+        RETURN rec;
+    END IF;
+
+    SELECT to_jsonb(a) INTO rec
+      FROM (SELECT id, employee_id, date, punch_in, punch_out, hours_worked
+              FROM attendance WHERE employee_id = p_emp AND date = p_date) a;
+    IF rec IS NULL OR rec->>'punch_in' IS NULL THEN
+        RETURN jsonb_build_object('error', 'No punch-in record found for today');
+    END IF;
+    RETURN jsonb_build_object('error', 'Already punched out today', 'record', rec);
+END;
+$$;
 
 -- ================================================
 -- ADMIN DATABASE TABLES (Can be same or separate DB)
@@ -121,9 +404,23 @@ CREATE TABLE IF NOT EXISTS admin_activity_log (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Admin rows use the same updated_at trigger (recreated here in case the
+-- admin tables live in a separate database)
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_admins_updated ON admins;
+CREATE TRIGGER trg_admins_updated BEFORE UPDATE ON admins
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
 -- Indexes for admin tables
 CREATE INDEX IF NOT EXISTS idx_admins_admin_id ON admins(admin_id);
-CREATE INDEX IF NOT EXISTS idx_admin_log_admin_id ON admin_activity_log(admin_id);
+CREATE INDEX IF NOT EXISTS idx_admins_active_registered ON admins(is_active, is_registered);
+CREATE INDEX IF NOT EXISTS idx_admin_log_admin_created ON admin_activity_log(admin_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_admin_log_created_at ON admin_activity_log(created_at);
 
 -- Enable Row Level Security
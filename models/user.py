@@ -2,9 +2,28 @@
 User Model
 Handles all user-related database operations
 """
-from datetime import datetime
+import logging
+import re
+import threading
 from typing import Optional, Dict, List, Any
-from .database import Database
+from cachetools import TTLCache
+from config import Config
+from .database import Database, retry_db_operation
+
+logger = logging.getLogger(__name__)
+
+
+# Recently fetched users (only hits are cached): full rows keyed by
+# employee_id, narrower projections keyed by (employee_id, fields)
+_user_cache = TTLCache(maxsize=Config.LOOKUP_CACHE_SIZE, ttl=Config.LOOKUP_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+# Characters with meaning in a PostgREST or_() filter or ILIKE pattern
+_SEARCH_UNSAFE_CHARS = re.compile(r'[,()"\\*%:]')
+
+
+# Registered-user lists per projection, refreshed at most every REGISTERED_CACHE_TTL seconds
+_registered_cache = TTLCache(maxsize=4, ttl=Config.REGISTERED_CACHE_TTL)
 
 
 class UserModel:
@@ -12,15 +31,41 @@ class UserModel:
     
     TABLE_NAME = "users"
     
+    # Column projections: full row, list views, and hot recognition paths
+    FIELDS_ALL = "*"
+    FIELDS_LIST = "employee_id,name,email,department,registered_by,is_registered,created_at"
+    FIELDS_MINIMAL = "employee_id,name,email,department,is_registered"
+    
+    # Maximum rows returned by search()
+    SEARCH_LIMIT = 50
+    
+    # Postgres error code raised when attendance rows still reference a user
+    FOREIGN_KEY_VIOLATION = "23503"
+    
     @classmethod
     def _get_client(cls):
         return Database.get_client()
     
+    @classmethod
+    def _execute(cls, query):
+        """Run query(client), retrying transient connection failures"""
+        return retry_db_operation(lambda: query(cls._get_client()), Database)
+    
+    @staticmethod
+    def invalidate_cache(employee_id: str) -> None:
+        """Drop a cached user so the next lookup reads from the database"""
+        with _user_cache_lock:
+            _user_cache.pop(employee_id, None)
+            for key in [k for k in _user_cache if isinstance(k, tuple) and k[0] == employee_id]:
+                _user_cache.pop(key, None)
+            _registered_cache.clear()
+    
     @classmethod
     def create(cls, employee_id: str, name: str, email: str, 
-               department: str = None, registered_by: str = None) -> Optional[Dict[str, Any]]:
+               department: str = None, registered_by: str = None,
+               is_registered: bool = False) -> Optional[Dict[str, Any]]:
         """
-        Create a new user
+        Create a user, or update the existing one with the same employee_id
         
         Args:
             employee_id: Unique employee identifier
@@ -28,9 +73,10 @@ class UserModel:
             email: Email address
             department: Department name
             registered_by: Admin ID who registered this user
+            is_registered: Whether the user's face is registered
         
         Returns:
-            Created user record or None
+            Created or updated user record or None
         """
         client = cls._get_client()
         if not client:
@@ -42,31 +88,100 @@ class UserModel:
             "email": email,
             "department": department,
             "registered_by": registered_by,
-            "is_registered": False,
-            "created_at": datetime.utcnow().isoformat()
+            "is_registered": is_registered
         }
         
         try:
-            result = client.table(cls.TABLE_NAME).insert(user_data).execute()
+            # Upsert so a retried registration returns the row in one round-trip;
+            # created_at is left out so the original creation time is kept
+            result = cls._execute(lambda client: client.table(cls.TABLE_NAME).upsert(
+                user_data, on_conflict="employee_id"
+            ).execute())
             return result.data[0] if result.data else None
         except Exception as e:
-            print(f"Error creating user: {e}")
+            logger.warning("Error creating user: %s", e)
             return None
+        finally:
+            # After the write, so a concurrent lookup cannot re-cache the old row
+            cls.invalidate_cache(employee_id)
     
     @classmethod
-    def get_by_employee_id(cls, employee_id: str) -> Optional[Dict[str, Any]]:
-        """Get user by employee ID"""
+    def get_by_employee_id(cls, employee_id: str,
+                           fields: str = FIELDS_ALL) -> Optional[Dict[str, Any]]:
+        """
+        Get user by employee ID
+        
+        Rows are cached for Config.LOOKUP_CACHE_TTL seconds per projection;
+        a cached full row also answers narrower projections.
+        """
+        projection_key = employee_id if fields == cls.FIELDS_ALL else (employee_id, fields)
+        with _user_cache_lock:
+            cached = _user_cache.get(employee_id)
+            if cached is None:
+                cached = _user_cache.get(projection_key)
+        if cached is not None:
+            return cached
+        
         client = cls._get_client()
         if not client:
             return None
         
         try:
-            result = client.table(cls.TABLE_NAME).select("*").eq("employee_id", employee_id).execute()
-            return result.data[0] if result.data else None
+            result = cls._execute(lambda client: client.table(cls.TABLE_NAME).select(fields).eq("employee_id", employee_id).execute())
+            user = result.data[0] if result.data else None
+            if user is not None:
+                with _user_cache_lock:
+                    _user_cache[projection_key] = user
+            return user
         except Exception as e:
-            print(f"Error fetching user: {e}")
+            logger.warning("Error fetching user: %s", e)
             return None
     
+    @classmethod
+    def get_many_by_ids(cls, employee_ids: List[str],
+                        columns: str = "employee_id,name,department") -> Dict[str, Dict[str, Any]]:
+        """
+        Get users for several employee IDs in one query, keyed by employee ID
+        
+        IDs already in the lookup cache are served from it; the rest are
+        fetched with a single IN query. Full rows (columns="*") are added
+        to the cache.
+        """
+        employee_ids = list(dict.fromkeys(eid for eid in employee_ids if eid))
+        if not employee_ids:
+            return {}
+        
+        users = {}
+        with _user_cache_lock:
+            for employee_id in employee_ids:
+                cached = _user_cache.get(employee_id)
+                if cached is not None:
+                    users[employee_id] = cached
+        
+        missing = [eid for eid in employee_ids if eid not in users]
+        if not missing:
+            return users
+        
+        client = cls._get_client()
+        if not client:
+            return users
+        
+        try:
+            result = cls._execute(lambda client: client.table(cls.TABLE_NAME).select(
+                columns
+            ).in_("employee_id", missing).execute())
+            fetched = {u['employee_id']: u for u in result.data} if result.data else {}
+        except Exception as e:
+            logger.warning("Error fetching users: %s", e)
+            return users
+        
+        if columns == "*" and fetched:
+            with _user_cache_lock:
+                _user_cache.update(fetched)
+        
+        users.update(fetched)
+        return users
+    
     @classmethod
     def get_by_id(cls, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user by database ID"""
@@ -75,38 +190,53 @@ class UserModel:
             return None
         
         try:
-            result = client.table(cls.TABLE_NAME).select("*").eq("id", user_id).execute()
+            result = cls._execute(lambda client: client.table(cls.TABLE_NAME).select("*").eq("id", user_id).execute())
             return result.data[0] if result.data else None
         except Exception as e:
-            print(f"Error fetching user: {e}")
+            logger.warning("Error fetching user: %s", e)
             return None
     
     @classmethod
-    def get_all(cls) -> List[Dict[str, Any]]:
-        """Get all users"""
+    def get_all(cls, fields: str = FIELDS_LIST, limit: int = None,
+                offset: int = 0) -> List[Dict[str, Any]]:
+        """Get all users, newest first (one page if limit is given)"""
         client = cls._get_client()
         if not client:
             return []
         
+        def query(client):
+            builder = client.table(cls.TABLE_NAME).select(fields).order("created_at", desc=True)
+            if limit is not None:
+                builder = builder.range(offset, offset + limit - 1)
+            return builder.execute()
+        
         try:
-            result = client.table(cls.TABLE_NAME).select("*").order("created_at", desc=True).execute()
+            result = cls._execute(query)
             return result.data if result.data else []
         except Exception as e:
-            print(f"Error fetching users: {e}")
+            logger.warning("Error fetching users: %s", e)
             return []
     
     @classmethod
-    def get_registered(cls) -> List[Dict[str, Any]]:
-        """Get all users with registered faces"""
+    def get_registered(cls, fields: str = FIELDS_LIST) -> List[Dict[str, Any]]:
+        """Get all users with registered faces (cached for Config.REGISTERED_CACHE_TTL seconds)"""
+        with _user_cache_lock:
+            cached = _registered_cache.get(fields)
+        if cached is not None:
+            return list(cached)
+        
         client = cls._get_client()
         if not client:
             return []
         
         try:
-            result = client.table(cls.TABLE_NAME).select("*").eq("is_registered", True).execute()
-            return result.data if result.data else []
+            result = cls._execute(lambda client: client.table(cls.TABLE_NAME).select(fields).eq("is_registered", True).execute())
+            users = result.data if result.data else []
+            with _user_cache_lock:
+                _registered_cache[fields] = users
+            return list(users)
         except Exception as e:
-            print(f"Error fetching registered users: {e}")
+            logger.warning("Error fetching registered users: %s", e)
             return []
     
     @classmethod
@@ -117,13 +247,16 @@ class UserModel:
             return False
         
         try:
-            result = client.table(cls.TABLE_NAME).update({
+            result = cls._execute(lambda client: client.table(cls.TABLE_NAME).update({
                 "is_registered": is_registered
-            }).eq("employee_id", employee_id).execute()
+            }).eq("employee_id", employee_id).execute())
             return len(result.data) > 0 if result.data else False
         except Exception as e:
-            print(f"Error updating user: {e}")
+            logger.warning("Error updating user: %s", e)
             return False
+        finally:
+            # After the write, so a concurrent lookup cannot re-cache the old row
+            cls.invalidate_cache(employee_id)
     
     @classmethod
     def delete(cls, employee_id: str) -> bool:
@@ -133,27 +266,45 @@ class UserModel:
             return False
         
         try:
-            # First delete attendance records
-            client.table("attendance").delete().eq("employee_id", employee_id).execute()
-            # Then delete user
-            result = client.table(cls.TABLE_NAME).delete().eq("employee_id", employee_id).execute()
+            # attendance.employee_id is ON DELETE CASCADE, so one delete suffices
+            result = cls._execute(lambda client: client.table(cls.TABLE_NAME).delete().eq("employee_id", employee_id).execute())
+            return len(result.data) > 0 if result.data else False
+        except Exception as e:
+            if getattr(e, 'code', None) != cls.FOREIGN_KEY_VIOLATION:
+                logger.warning("Error deleting user: %s", e)
+                return False
+        finally:
+            # After the write, so a concurrent lookup cannot re-cache the old row
+            cls.invalidate_cache(employee_id)
+        
+        # Schema without the cascade: delete attendance records first
+        try:
+            cls._execute(lambda client: client.table("attendance").delete().eq("employee_id", employee_id).execute())
+            result = cls._execute(lambda client: client.table(cls.TABLE_NAME).delete().eq("employee_id", employee_id).execute())
             return len(result.data) > 0 if result.data else False
         except Exception as e:
-            print(f"Error deleting user: {e}")
+            logger.warning("Error deleting user: %s", e)
             return False
+        finally:
+            cls.invalidate_cache(employee_id)
     
     @classmethod
     def search(cls, query: str) -> List[Dict[str, Any]]:
-        """Search users by name or employee ID"""
+        """Search users by name or employee ID (substring match, trigram-indexed)"""
+        # Strip filter syntax so user input cannot alter the or_() expression
+        query = _SEARCH_UNSAFE_CHARS.sub(' ', query).strip()
+        if not query:
+            return []
+        
         client = cls._get_client()
         if not client:
             return []
         
         try:
-            result = client.table(cls.TABLE_NAME).select("*").or_(
+            result = cls._execute(lambda client: client.table(cls.TABLE_NAME).select("*").or_(
                 f"name.ilike.%{query}%,employee_id.ilike.%{query}%"
-            ).execute()
+            ).limit(cls.SEARCH_LIMIT).execute())
             return result.data if result.data else []
         except Exception as e:
-            print(f"Error searching users: {e}")
+            logger.warning("Error searching users: %s", e)
             return []
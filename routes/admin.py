@@ -4,16 +4,15 @@ Handles admin registration, authentication, and management
 """
 from flask import Blueprint, request, jsonify
 from services.admin_auth import get_admin_auth_service
-from services import AntiSpoofingService, ImagePreprocessor
-from utils.helpers import decode_base64_image
+from services import get_antispoof_service, get_preprocessor
+from utils.helpers import (
+    decode_base64_image, decode_base64_images, submit_base64_images,
+    collect_images, cancel_images, exceeds_image_limit, clamp_page_limit
+)
 from config import Config, AdminConfig
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
-# Initialize services
-antispoof_service = AntiSpoofingService()
-preprocessor = ImagePreprocessor()
-
 
 @admin_bp.route('/check-first', methods=['GET'])
 def check_first_admin():
@@ -43,10 +42,17 @@ def register_admin():
         "session_token": "token" (required if not first admin)
     }
     """
+    pending_images = []
     try:
-        data = request.json
+        data = request.get_json(silent=True)
         admin_service = get_admin_auth_service()
         
+        if not data:
+            return jsonify({
+                "success": False,
+                "message": "No data provided"
+            }), 400
+        
         # Validate required fields
         required_fields = ['admin_id', 'name', 'email', 'images']
         for field in required_fields:
@@ -56,14 +62,26 @@ def register_admin():
                     "message": f"Missing required field: {field}"
                 }), 400
         
+        if exceeds_image_limit(data['images']):
+            return jsonify({
+                "success": False,
+                "message": "Image too large"
+            }), 413
+        
+        # Sessions are checked in memory, so a super admin's images can start
+        # decoding while the first-admin check waits on the database; anyone
+        # else's are only decoded once the checks below have passed
+        session = admin_service.verify_session(data.get('session_token'))
+        if session.get('valid') and session.get('role') == 'super_admin' and len(data['images']) >= 3:
+            pending_images = submit_base64_images(
+                data['images'], get_preprocessor().preprocess_for_recognition, Config.IMAGE_DECODE_REDUCTION
+            )
+        
         # Check if this is first admin
         is_first = admin_service.is_first_admin()
         
         if not is_first:
-            # Verify session token for existing admin
-            session_token = data.get('session_token')
-            session = admin_service.verify_session(session_token)
-            
+            # Existing admins must hold a valid session
             if not session.get('valid'):
                 return jsonify({
                     "success": False,
@@ -84,16 +102,11 @@ def register_admin():
                 "message": "Please provide at least 3 images for registration"
             }), 400
         
-        # Decode and preprocess images
-        images = []
-        for img_base64 in data['images']:
-            try:
-                image = decode_base64_image(img_base64)
-                if image is not None:
-                    image = preprocessor.preprocess_for_recognition(image)
-                    images.append(image)
-            except Exception as e:
-                continue
+        if not pending_images:
+            pending_images = submit_base64_images(
+                data['images'], get_preprocessor().preprocess_for_recognition, Config.IMAGE_DECODE_REDUCTION
+            )
+        images = collect_images(pending_images)
         
         if len(images) < 3:
             return jsonify({
@@ -103,7 +116,7 @@ def register_admin():
         
         # Anti-spoofing check
         if Config.SPOOF_DETECTION_ENABLED:
-            texture_check = antispoof_service.analyze_texture(images[0])
+            texture_check = get_antispoof_service().analyze_texture(images[0])
             if not texture_check.get("is_real", True):
                 return jsonify({
                     "success": False,
@@ -131,6 +144,9 @@ def register_admin():
             "success": False,
             "message": f"Admin registration failed: {str(e)}"
         }), 500
+    finally:
+        # Don't keep decoding images for a rejected request
+        cancel_images(pending_images)
 
 
 @admin_bp.route('/authenticate', methods=['POST'])
@@ -144,16 +160,28 @@ def authenticate_admin():
         "spoof_frames": ["base64_frame1", ...] (optional)
     }
     """
+    pending_image = []
     try:
-        data = request.json
+        data = request.get_json(silent=True)
         admin_service = get_admin_auth_service()
         
-        if 'image' not in data or not data['image']:
+        if not data or not data.get('image'):
             return jsonify({
                 "success": False,
                 "message": "No image provided"
             }), 400
         
+        if exceeds_image_limit([data['image'], *(data.get('spoof_frames') or [])]):
+            return jsonify({
+                "success": False,
+                "message": "Image too large"
+            }), 413
+        
+        # Decode and preprocess the image while checking for admins
+        pending_image = submit_base64_images(
+            [data['image']], get_preprocessor().preprocess_for_recognition, Config.IMAGE_DECODE_REDUCTION
+        )
+        
         # Check if there are any admins
         if admin_service.is_first_admin():
             return jsonify({
@@ -162,23 +190,31 @@ def authenticate_admin():
                 "requires_setup": True
             }), 400
         
-        # Decode and preprocess image
-        image = decode_base64_image(data['image'])
-        if image is None:
+        images = collect_images(pending_image)
+        if not images:
             return jsonify({
                 "success": False,
                 "message": "Could not decode image"
             }), 400
         
-        image = preprocessor.preprocess_for_recognition(image)
+        image = images[0]
         
         # Anti-spoofing check if frames provided
-        if Config.SPOOF_DETECTION_ENABLED and 'spoof_frames' in data:
-            frames = []
-            for frame_b64 in data['spoof_frames']:
-                frame = decode_base64_image(frame_b64)
-                if frame is not None:
-                    frames.append(frame)
+        spoof_frames = data.get('spoof_frames') or []
+        if Config.SPOOF_DETECTION_ENABLED and len(spoof_frames) >= 5:
+            # Cheap texture test on the first frame rejects obvious spoofs
+            # before decoding the rest for the full check
+            antispoof_service = get_antispoof_service()
+            first_frame = decode_base64_image(spoof_frames[0], Config.IMAGE_DECODE_REDUCTION)
+            if first_frame is not None and not antispoof_service.analyze_texture(first_frame).get("is_real", True):
+                return jsonify({
+                    "success": False,
+                    "message": "Liveness check failed. Please use a live camera."
+                }), 400
+            
+            frames = decode_base64_images(spoof_frames[1:], reduce=Config.IMAGE_DECODE_REDUCTION)
+            if first_frame is not None:
+                frames.insert(0, first_frame)
             
             if len(frames) >= 5:
                 spoof_result = antispoof_service.comprehensive_spoof_check(frames)
@@ -201,6 +237,8 @@ def authenticate_admin():
             "success": False,
             "message": f"Authentication failed: {str(e)}"
         }), 500
+    finally:
+        cancel_images(pending_image)
 
 
 @admin_bp.route('/verify-session', methods=['POST'])
@@ -214,7 +252,7 @@ def verify_session():
     }
     """
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         admin_service = get_admin_auth_service()
         
         session_token = data.get('session_token')
@@ -233,7 +271,7 @@ def verify_session():
 def extend_session():
     """Extend admin session"""
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         admin_service = get_admin_auth_service()
         
         session_token = data.get('session_token')
@@ -252,7 +290,7 @@ def extend_session():
 def logout():
     """Logout admin (invalidate session)"""
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         admin_service = get_admin_auth_service()
         
         session_token = data.get('session_token')
@@ -295,13 +333,16 @@ def get_activity_log():
     try:
         admin_service = get_admin_auth_service()
         admin_id = request.args.get('admin_id')
-        limit = int(request.args.get('limit', 50))
+        limit = clamp_page_limit(request.args.get('limit', type=int))
+        before = request.args.get('before')
         
-        logs = admin_service.get_activity_log(admin_id, limit)
+        logs = admin_service.get_activity_log(admin_id, limit, before)
         
         return jsonify({
             "success": True,
-            "logs": logs
+            "logs": logs,
+            # Pass back as ?before= to fetch the next page
+            "next_before": logs[-1]['created_at'] if len(logs) == limit else None
         })
         
     except Exception as e:
@@ -315,7 +356,7 @@ def get_activity_log():
 def deactivate_admin(admin_id):
     """Deactivate an admin account"""
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         admin_service = get_admin_auth_service()
         
         # Verify session
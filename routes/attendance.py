@@ -2,19 +2,193 @@
 Attendance Routes
 Handles punch-in/punch-out and attendance reporting
 """
-from flask import Blueprint, request, jsonify
-from datetime import datetime
-from services import FaceRecognitionService, AntiSpoofingService, ImagePreprocessor
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from datetime import date, datetime
+from typing import Optional, Dict, Any, Tuple
+from services import get_face_service, get_antispoof_service, get_preprocessor
 from models import UserModel, AttendanceModel, AdminModel
-from utils.helpers import decode_base64_image
+from utils.helpers import decode_base64_image, decode_base64_images, exceeds_image_limit, submit_image_task
 from config import Config
 
 attendance_bp = Blueprint('attendance', __name__, url_prefix='/api/attendance')
 
-# Initialize services
-face_service = FaceRecognitionService()
-antispoof_service = AntiSpoofingService()
-preprocessor = ImagePreprocessor()
+
+def _check_liveness(image, data) -> Optional[Dict[str, Any]]:
+    """
+    Run anti-spoofing for an attendance request
+    
+    A clearly real texture on the main image passes without decoding the
+    spoof frames (comprehensive_spoof_check passes on real texture as well);
+    otherwise the frames get the full check.
+    
+    Returns:
+        The spoof check result if liveness failed, otherwise None
+    """
+    if not Config.SPOOF_DETECTION_ENABLED or 'spoof_frames' not in data:
+        return None
+    
+    antispoof_service = get_antispoof_service()
+    texture_check = antispoof_service.analyze_texture(image)
+    if texture_check.get('is_real') and texture_check.get('confidence', 0) >= Config.SPOOF_FAST_PASS_CONFIDENCE:
+        return None
+    
+    spoof_frames = data['spoof_frames']
+    if spoof_frames and spoof_frames[0] == data.get('image'):
+        # Clients often send the main shot as the first frame; reuse its decode
+        frames = [image] + decode_base64_images(spoof_frames[1:])
+    else:
+        frames = decode_base64_images(spoof_frames)
+    if len(frames) >= 5:
+        spoof_result = antispoof_service.comprehensive_spoof_check(frames)
+        if not spoof_result.get('overall_is_real', True):
+            return spoof_result
+    return None
+
+
+def _identify(image) -> Dict[str, Any]:
+    """Preprocess an attendance image and identify the user or admin in it"""
+    image = get_preprocessor().preprocess_for_recognition(image)
+    return get_face_service().identify_face(image, include_admins=True)
+
+
+def _lookup_person(employee_id: str) -> Tuple[str, Optional[str]]:
+    """Name and department for an identified user or admin"""
+    user = UserModel.get_by_employee_id(employee_id, fields=UserModel.FIELDS_MINIMAL)
+    if user:
+        return user.get('name', employee_id), user.get('department')
+    
+    # Check if it's an admin
+    admin = AdminModel.get_by_admin_id(employee_id)
+    if admin:
+        return admin.get('name', employee_id), 'Admin'
+    return employee_id, None
+
+
+def _process_attendance(data: Optional[Dict[str, Any]], action: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Shared pipeline for the punch endpoints:
+    decode -> (liveness || preprocess + identify) -> record
+    
+    Args:
+        data: Request JSON
+        action: 'in', 'out', or 'auto' (punch in or out based on today's record)
+    
+    Returns:
+        (response payload, HTTP status)
+    """
+    if not data:
+        return {
+            "success": False,
+            "message": "No data provided"
+        }, 400
+    
+    if not data.get('image'):
+        return {
+            "success": False,
+            "message": "No image provided"
+        }, 400
+    
+    if exceeds_image_limit([data['image'], *(data.get('spoof_frames') or [])]):
+        return {
+            "success": False,
+            "message": "Image too large"
+        }, 413
+    
+    # Decode image
+    image = decode_base64_image(data['image'])
+    if image is None:
+        return {
+            "success": False,
+            "message": "Could not decode image"
+        }, 400
+    
+    # Preprocess and identify (includes admins) on the image pool while the
+    # liveness check runs here; both release the GIL in OpenCV/dlib, so the
+    # stages overlap on separate cores. Spoof attempts waste the identification.
+    identify_future = submit_image_task(_identify, image)
+    
+    # Anti-spoofing check if frames provided
+    spoof_result = _check_liveness(image, data)
+    if spoof_result:
+        identify_future.cancel()
+        return {
+            "success": False,
+            "message": "Liveness check failed. Please ensure you're using a live camera.",
+            "spoof_details": spoof_result
+        }, 400
+    
+    identify_result = identify_future.result()
+    
+    if not identify_result['success']:
+        return identify_result, 400
+    
+    employee_id = identify_result['person_id']
+    confidence = identify_result.get('confidence', 0)
+    auto = action == 'auto'
+    # A plain punch-out gets the name and department back with the updated record
+    person = None if action == 'out' else _lookup_person(employee_id)
+    
+    if auto:
+        # Check current attendance status and auto-determine action
+        existing_record = AttendanceModel.get_today_record(employee_id)
+        if existing_record and existing_record.get('punch_out'):
+            user_name = person[0]
+            return {
+                "success": False,
+                "message": f"Attendance already complete for {user_name} today",
+                "employee_id": employee_id,
+                "name": user_name
+            }, 400
+        action = 'out' if existing_record and existing_record.get('punch_in') else 'in'
+    
+    if action == 'in':
+        attendance_result = AttendanceModel.record_punch_in(employee_id, confidence)
+    elif auto:
+        # Discard attendance if punch-out comes too soon after punch-in
+        attendance_result = AttendanceModel.record_punch_out_with_validation(
+            employee_id,
+            confidence,
+            min_duration_seconds=20  # Minimum 20 seconds between punch-in and punch-out
+        )
+    else:
+        attendance_result = AttendanceModel.record_punch_out(employee_id, confidence)
+    
+    if attendance_result and 'error' in attendance_result:
+        return {
+            "success": False,
+            "message": attendance_result['error'],
+            "employee_id": employee_id
+        }, 400
+    
+    if person is None:
+        if attendance_result and attendance_result.get('name'):
+            person = attendance_result['name'], attendance_result.get('department')
+        else:
+            person = _lookup_person(employee_id)
+    user_name, department = person
+    
+    if attendance_result and attendance_result.get('discarded'):
+        return {
+            "success": False,
+            "message": f"Attendance discarded - punch-out too soon after punch-in (within {attendance_result.get('duration_seconds', 0):.0f} seconds)",
+            "employee_id": employee_id,
+            "name": user_name
+        }, 400
+    
+    payload = {
+        "success": True,
+        "message": f"Punch-{action} recorded for {user_name}",
+        "employee_id": employee_id,
+        "name": user_name,
+        "department": department,
+        "confidence": confidence,
+        "time": datetime.now().isoformat(sep=' ', timespec='seconds')
+    }
+    if auto:
+        payload["action"] = "Punch In" if action == 'in' else "Punch Out"
+    if action == 'out':
+        payload["hours_worked"] = attendance_result.get('hours_worked', 0) if attendance_result else 0
+    return payload, 200
 
 
 @attendance_bp.route('/mark', methods=['POST'])
@@ -34,142 +208,8 @@ def mark_attendance():
     - If punch-out within 10-20 seconds of punch-in → Discard attendance
     """
     try:
-        data = request.json
-        
-        if not data:
-            return jsonify({
-                "success": False,
-                "message": "No data provided"
-            }), 400
-        
-        if 'image' not in data or not data['image']:
-            return jsonify({
-                "success": False,
-                "message": "No image provided"
-            }), 400
-        
-        # Decode and preprocess image
-        image = decode_base64_image(data['image'])
-        if image is None:
-            return jsonify({
-                "success": False,
-                "message": "Could not decode image"
-            }), 400
-        
-        image = preprocessor.preprocess_for_recognition(image)
-        
-        # Anti-spoofing check if frames provided
-        if Config.SPOOF_DETECTION_ENABLED and 'spoof_frames' in data:
-            frames = []
-            for frame_b64 in data['spoof_frames']:
-                frame = decode_base64_image(frame_b64)
-                if frame is not None:
-                    frames.append(frame)
-            
-            if len(frames) >= 5:
-                spoof_result = antispoof_service.comprehensive_spoof_check(frames)
-                if not spoof_result.get('overall_is_real', True):
-                    return jsonify({
-                        "success": False,
-                        "message": "Liveness check failed. Please ensure you're using a live camera.",
-                        "spoof_details": spoof_result
-                    }), 400
-        
-        # Identify face (includes admins)
-        identify_result = face_service.identify_face(image, include_admins=True)
-        
-        if not identify_result['success']:
-            return jsonify(identify_result), 400
-        
-        employee_id = identify_result['person_id']
-        confidence = identify_result.get('confidence', 0)
-        
-        # Get user or admin name
-        user = UserModel.get_by_employee_id(employee_id)
-        if user:
-            user_name = user.get('name', employee_id)
-            department = user.get('department')
-        else:
-            # Check if it's an admin
-            admin = AdminModel.get_by_admin_id(employee_id)
-            if admin:
-                user_name = admin.get('name', employee_id)
-                department = 'Admin'
-            else:
-                user_name = employee_id
-                department = None
-        
-        # Check current attendance status and auto-determine action
-        existing_record = AttendanceModel.get_today_record(employee_id)
-        
-        if not existing_record or not existing_record.get('punch_in'):
-            # No punch-in today → Record punch-in
-            attendance_result = AttendanceModel.record_punch_in(employee_id, confidence)
-            
-            if attendance_result and 'error' in attendance_result:
-                return jsonify({
-                    "success": False,
-                    "message": attendance_result['error'],
-                    "employee_id": employee_id
-                }), 400
-            
-            return jsonify({
-                "success": True,
-                "message": f"Punch-in recorded for {user_name}",
-                "action": "Punch In",
-                "employee_id": employee_id,
-                "name": user_name,
-                "department": department,
-                "confidence": confidence,
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-        
-        elif existing_record.get('punch_out'):
-            # Already punched out today
-            return jsonify({
-                "success": False,
-                "message": f"Attendance already complete for {user_name} today",
-                "employee_id": employee_id,
-                "name": user_name
-            }), 400
-        
-        else:
-            # Has punch-in but no punch-out → Record punch-out
-            # First check if punch-out is within 10-20 seconds of punch-in (discard if so)
-            attendance_result = AttendanceModel.record_punch_out_with_validation(
-                employee_id, 
-                confidence,
-                min_duration_seconds=20  # Minimum 20 seconds between punch-in and punch-out
-            )
-            
-            if attendance_result and 'error' in attendance_result:
-                return jsonify({
-                    "success": False,
-                    "message": attendance_result['error'],
-                    "employee_id": employee_id
-                }), 400
-            
-            if attendance_result and attendance_result.get('discarded'):
-                return jsonify({
-                    "success": False,
-                    "message": f"Attendance discarded - punch-out too soon after punch-in (within {attendance_result.get('duration_seconds', 0):.0f} seconds)",
-                    "employee_id": employee_id,
-                    "name": user_name
-                }), 400
-            
-            hours_worked = attendance_result.get('hours_worked', 0) if attendance_result else 0
-            
-            return jsonify({
-                "success": True,
-                "message": f"Punch-out recorded for {user_name}",
-                "action": "Punch Out",
-                "employee_id": employee_id,
-                "name": user_name,
-                "department": department,
-                "confidence": confidence,
-                "hours_worked": hours_worked,
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
+        payload, status = _process_attendance(request.get_json(silent=True), 'auto')
+        return jsonify(payload), status
         
     except Exception as e:
         return jsonify({
@@ -190,90 +230,8 @@ def punch_in():
     }
     """
     try:
-        data = request.json
-        
-        if not data:
-            return jsonify({
-                "success": False,
-                "message": "No data provided"
-            }), 400
-        
-        if 'image' not in data or not data['image']:
-            return jsonify({
-                "success": False,
-                "message": "No image provided"
-            }), 400
-        
-        # Decode and preprocess image
-        image = decode_base64_image(data['image'])
-        if image is None:
-            return jsonify({
-                "success": False,
-                "message": "Could not decode image"
-            }), 400
-        
-        image = preprocessor.preprocess_for_recognition(image)
-        
-        # Anti-spoofing check if frames provided
-        if Config.SPOOF_DETECTION_ENABLED and 'spoof_frames' in data:
-            frames = []
-            for frame_b64 in data['spoof_frames']:
-                frame = decode_base64_image(frame_b64)
-                if frame is not None:
-                    frames.append(frame)
-            
-            if len(frames) >= 5:
-                spoof_result = antispoof_service.comprehensive_spoof_check(frames)
-                if not spoof_result.get('overall_is_real', True):
-                    return jsonify({
-                        "success": False,
-                        "message": "Liveness check failed. Please ensure you're using a live camera.",
-                        "spoof_details": spoof_result
-                    }), 400
-        
-        # Identify face (includes admins)
-        identify_result = face_service.identify_face(image, include_admins=True)
-        
-        if not identify_result['success']:
-            return jsonify(identify_result), 400
-        
-        employee_id = identify_result['person_id']
-        confidence = identify_result.get('confidence', 0)
-        
-        # Record punch-in
-        attendance_result = AttendanceModel.record_punch_in(employee_id, confidence)
-        
-        if attendance_result and 'error' in attendance_result:
-            return jsonify({
-                "success": False,
-                "message": attendance_result['error'],
-                "employee_id": employee_id
-            }), 400
-        
-        # Get user or admin name
-        user = UserModel.get_by_employee_id(employee_id)
-        if user:
-            user_name = user.get('name', employee_id)
-            department = user.get('department')
-        else:
-            # Check if it's an admin
-            admin = AdminModel.get_by_admin_id(employee_id)
-            if admin:
-                user_name = admin.get('name', employee_id)
-                department = 'Admin'
-            else:
-                user_name = employee_id
-                department = None
-        
-        return jsonify({
-            "success": True,
-            "message": f"Punch-in recorded for {user_name}",
-            "employee_id": employee_id,
-            "name": user_name,
-            "department": department,
-            "confidence": confidence,
-            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+        payload, status = _process_attendance(request.get_json(silent=True), 'in')
+        return jsonify(payload), status
         
     except Exception as e:
         return jsonify({
@@ -294,92 +252,8 @@ def punch_out():
     }
     """
     try:
-        data = request.json
-        
-        if not data:
-            return jsonify({
-                "success": False,
-                "message": "No data provided"
-            }), 400
-        
-        if 'image' not in data or not data['image']:
-            return jsonify({
-                "success": False,
-                "message": "No image provided"
-            }), 400
-        
-        # Decode and preprocess image
-        image = decode_base64_image(data['image'])
-        if image is None:
-            return jsonify({
-                "success": False,
-                "message": "Could not decode image"
-            }), 400
-        
-        image = preprocessor.preprocess_for_recognition(image)
-        
-        # Anti-spoofing check if frames provided
-        if Config.SPOOF_DETECTION_ENABLED and 'spoof_frames' in data:
-            frames = []
-            for frame_b64 in data['spoof_frames']:
-                frame = decode_base64_image(frame_b64)
-                if frame is not None:
-                    frames.append(frame)
-            
-            if len(frames) >= 5:
-                spoof_result = antispoof_service.comprehensive_spoof_check(frames)
-                if not spoof_result.get('overall_is_real', True):
-                    return jsonify({
-                        "success": False,
-                        "message": "Liveness check failed. Please ensure you're using a live camera."
-                    }), 400
-        
-        # Identify face (includes admins)
-        identify_result = face_service.identify_face(image, include_admins=True)
-        
-        if not identify_result['success']:
-            return jsonify(identify_result), 400
-        
-        employee_id = identify_result['person_id']
-        confidence = identify_result.get('confidence', 0)
-        
-        # Record punch-out
-        attendance_result = AttendanceModel.record_punch_out(employee_id, confidence)
-        
-        if attendance_result and 'error' in attendance_result:
-            return jsonify({
-                "success": False,
-                "message": attendance_result['error'],
-                "employee_id": employee_id
-            }), 400
-        
-        # Get user or admin name
-        user = UserModel.get_by_employee_id(employee_id)
-        if user:
-            user_name = user.get('name', employee_id)
-            department = user.get('department')
-        else:
-            # Check if it's an admin
-            admin = AdminModel.get_by_admin_id(employee_id)
-            if admin:
-                user_name = admin.get('name', employee_id)
-                department = 'Admin'
-            else:
-                user_name = employee_id
-                department = None
-        
-        hours_worked = attendance_result.get('hours_worked', 0) if attendance_result else 0
-        
-        return jsonify({
-            "success": True,
-            "message": f"Punch-out recorded for {user_name}",
-            "employee_id": employee_id,
-            "name": user_name,
-            "department": department,
-            "confidence": confidence,
-            "hours_worked": hours_worked,
-            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+        payload, status = _process_attendance(request.get_json(silent=True), 'out')
+        return jsonify(payload), status
         
     except Exception as e:
         return jsonify({
@@ -396,7 +270,7 @@ def get_today_attendance():
         
         return jsonify({
             "success": True,
-            "date": datetime.now().strftime("%Y-%m-%d"),
+            "date": date.today().isoformat(),
             "records": records
         })
         
@@ -448,14 +322,25 @@ def get_attendance_report():
                 "message": "start_date and end_date are required"
             }), 400
         
-        records = AttendanceModel.get_report(start_date, end_date, employee_id)
+        # Stream records page by page so large reports aren't held in memory
+        dumps = current_app.json.dumps
         
-        return jsonify({
-            "success": True,
-            "start_date": start_date,
-            "end_date": end_date,
-            "records": records
-        })
+        def generate():
+            yield '{"success":true,"start_date":%s,"end_date":%s,"records":[' % (
+                dumps(start_date), dumps(end_date)
+            )
+            first = True
+            try:
+                for page in AttendanceModel.iter_report(start_date, end_date, employee_id):
+                    chunk = ",".join(dumps(record) for record in page)
+                    yield chunk if first else "," + chunk
+                    first = False
+            except Exception as e:
+                # Headers are already sent; end the document cleanly
+                current_app.logger.warning("Error streaming report: %s", e)
+            yield "]}"
+        
+        return Response(stream_with_context(generate()), mimetype="application/json")
         
     except Exception as e:
         return jsonify({
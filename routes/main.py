@@ -4,16 +4,13 @@ Handles main pages and health check
 """
 from flask import Blueprint, render_template, jsonify
 from datetime import datetime
-from services import FaceRecognitionService
+from services import get_face_service
 from services.admin_auth import get_admin_auth_service
 from models import Database, AdminDatabase
 from config import Config
 
 main_bp = Blueprint('main', __name__)
 
-# Initialize services
-face_service = FaceRecognitionService()
-
 
 @main_bp.route('/')
 def index():
@@ -63,7 +60,7 @@ def health_check():
         "status": "healthy",
         "database": "connected" if Database.is_connected() else "not configured",
         "admin_database": "connected" if AdminDatabase.is_connected() else "not configured",
-        "registered_users": face_service.get_registered_count(),
+        "registered_users": get_face_service().get_registered_count(),
         "registered_admins": admin_service.face_service.get_registered_count(),
         "has_admin": not admin_service.is_first_admin(),
         "timestamp": datetime.now().isoformat()
@@ -88,7 +85,7 @@ def system_status():
             "admin": "connected" if AdminDatabase.is_connected() else "not configured"
         },
         "statistics": {
-            "registered_users": face_service.get_registered_count(),
+            "registered_users": get_face_service().get_registered_count(),
             "registered_admins": admin_service.face_service.get_registered_count()
         }
     })
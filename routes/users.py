@@ -3,19 +3,14 @@ User Routes
 Handles user registration with admin authorization
 """
 from flask import Blueprint, request, jsonify
-from services import FaceRecognitionService, AntiSpoofingService, ImagePreprocessor
+from services import get_face_service, get_antispoof_service, get_preprocessor
 from services.admin_auth import get_admin_auth_service
 from models import UserModel
-from utils.helpers import decode_base64_image
+from utils.helpers import decode_base64_image, decode_base64_images, exceeds_image_limit, clamp_page_limit
 from config import Config, AdminConfig
 
 users_bp = Blueprint('users', __name__, url_prefix='/api/users')
 
-# Initialize services
-face_service = FaceRecognitionService()
-antispoof_service = AntiSpoofingService()
-preprocessor = ImagePreprocessor()
-
 
 @users_bp.route('/register', methods=['POST'])
 def register_user():
@@ -34,9 +29,15 @@ def register_user():
     }
     """
     try:
-        data = request.json
+        data = request.get_json(silent=True)
         admin_service = get_admin_auth_service()
         
+        if not data:
+            return jsonify({
+                "success": False,
+                "message": "No data provided"
+            }), 400
+        
         # Validate required fields
         required_fields = ['employee_id', 'name', 'email', 'images', 'admin_session_token']
         for field in required_fields:
@@ -65,16 +66,16 @@ def register_user():
                 "message": "Please provide at least 3 images for registration"
             }), 400
         
-        # Decode and preprocess images
-        images = []
-        for img_base64 in data['images']:
-            try:
-                image = decode_base64_image(img_base64)
-                if image is not None:
-                    image = preprocessor.preprocess_for_recognition(image)
-                    images.append(image)
-            except Exception as e:
-                continue
+        if exceeds_image_limit(data['images']):
+            return jsonify({
+                "success": False,
+                "message": "Image too large"
+            }), 413
+        
+        # Decode and preprocess images in parallel
+        images = decode_base64_images(
+            data['images'], get_preprocessor().preprocess_for_recognition, Config.IMAGE_DECODE_REDUCTION
+        )
         
         if len(images) < 3:
             return jsonify({
@@ -84,7 +85,7 @@ def register_user():
         
         # Anti-spoofing check
         if Config.SPOOF_DETECTION_ENABLED:
-            texture_check = antispoof_service.analyze_texture(images[0])
+            texture_check = get_antispoof_service().analyze_texture(images[0])
             if not texture_check.get("is_real", True):
                 return jsonify({
                     "success": False,
@@ -92,23 +93,20 @@ def register_user():
                 }), 400
         
         # Register face
-        result = face_service.register_face(data['employee_id'], images)
+        result = get_face_service().register_face(data['employee_id'], images)
         
         if not result['success']:
             return jsonify(result), 400
         
-        # Save user to database
-        existing_user = UserModel.get_by_employee_id(data['employee_id'])
-        if not existing_user:
-            UserModel.create(
-                employee_id=data['employee_id'],
-                name=data['name'],
-                email=data['email'],
-                department=data.get('department', ''),
-                registered_by=admin_id
-            )
-        
-        UserModel.update_registration_status(data['employee_id'], True)
+        # Save user to database (creates or updates in one round-trip)
+        UserModel.create(
+            employee_id=data['employee_id'],
+            name=data['name'],
+            email=data['email'],
+            department=data.get('department', ''),
+            registered_by=admin_id,
+            is_registered=True
+        )
         
         # Log admin activity
         admin_service.log_user_registration(
@@ -143,14 +141,20 @@ def identify_user():
     }
     """
     try:
-        data = request.json
+        data = request.get_json(silent=True)
         
-        if 'image' not in data:
+        if not data or 'image' not in data:
             return jsonify({
                 "success": False,
                 "message": "No image provided"
             }), 400
         
+        if exceeds_image_limit([data['image']]):
+            return jsonify({
+                "success": False,
+                "message": "Image too large"
+            }), 413
+        
         # Decode and preprocess image
         image = decode_base64_image(data['image'])
         if image is None:
@@ -159,14 +163,14 @@ def identify_user():
                 "message": "Could not decode image"
             }), 400
         
-        image = preprocessor.preprocess_for_recognition(image)
+        image = get_preprocessor().preprocess_for_recognition(image)
         
         # Identify face
-        result = face_service.identify_face(image)
+        result = get_face_service().identify_face(image)
         
         if result['success']:
             # Get user details
-            user = UserModel.get_by_employee_id(result['person_id'])
+            user = UserModel.get_by_employee_id(result['person_id'], fields=UserModel.FIELDS_MINIMAL)
             if user:
                 result['user'] = {
                     'name': user.get('name'),
@@ -188,7 +192,10 @@ def identify_user():
 def list_users():
     """Get all users"""
     try:
-        users = UserModel.get_all()
+        # No limit returns every user (the admin panel relies on this)
+        limit = clamp_page_limit(request.args.get('limit', type=int), default=None)
+        offset = max(0, request.args.get('offset', 0, type=int))
+        users = UserModel.get_all(limit=limit, offset=offset)
         
         return jsonify({
             "success": True,
@@ -255,7 +262,7 @@ def delete_user(employee_id):
     }
     """
     try:
-        data = request.json or {}
+        data = request.get_json(silent=True) or {}
         admin_service = get_admin_auth_service()
         
         # Verify admin session
@@ -270,7 +277,7 @@ def delete_user(employee_id):
             }), 401
         
         # Delete face encoding
-        face_service.delete_face(employee_id)
+        get_face_service().delete_face(employee_id)
         
         # Delete from database
         UserModel.delete(employee_id)
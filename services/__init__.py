@@ -1,9 +1,9 @@
 """
 Services Package
 """
-from .face_recognition import FaceRecognitionService
-from .anti_spoofing import AntiSpoofingService
-from .image_processor import ImagePreprocessor
+from .face_recognition import FaceRecognitionService, get_face_service
+from .anti_spoofing import AntiSpoofingService, get_antispoof_service
+from .image_processor import ImagePreprocessor, get_preprocessor
 from .admin_auth import AdminAuthService
 from .yolo_detector import FastFaceDetector, YOLOFaceDetector, get_face_detector
 
@@ -11,6 +11,9 @@ __all__ = [
     'FaceRecognitionService', 
     'AntiSpoofingService', 
     'ImagePreprocessor',
+    'get_face_service',
+    'get_antispoof_service',
+    'get_preprocessor',
     'AdminAuthService',
     'FastFaceDetector',
     'YOLOFaceDetector',
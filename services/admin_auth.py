@@ -2,12 +2,27 @@
 Admin Authentication Service
 Handles admin face verification for authorization
 """
+import hashlib
+import re
 import time
 from typing import Dict, Any, Optional
 from config import Config, AdminConfig
 from models import AdminModel
 from .face_recognition import FaceRecognitionService
 
+# Shape of tokens issued by secrets.token_urlsafe(32)
+_TOKEN_RE = re.compile(r'[A-Za-z0-9_\-]{32,128}')
+
+
+def _is_well_formed_token(session_token) -> bool:
+    """Cheap shape check so malformed tokens are rejected before any lookup"""
+    return isinstance(session_token, str) and _TOKEN_RE.fullmatch(session_token) is not None
+
+
+def _session_key(session_token: str) -> bytes:
+    """Key under which a session is stored (the raw token is not kept in memory)"""
+    return hashlib.sha256(session_token.encode()).digest()
+
 
 class AdminAuthService:
     """
@@ -15,7 +30,8 @@ class AdminAuthService:
     Provides authorization layer before sensitive operations
     """
     
-    # Store active admin sessions {session_token: (admin_id, timestamp)}
+    # Store active admin sessions {sha256(session_token): (admin_id, timestamp, name, role)}
+    # Name and role are captured at login so verifying a session needs no lookup
     _active_sessions: Dict[str, tuple] = {}
     
     def __init__(self):
@@ -40,13 +56,7 @@ class AdminAuthService:
         Returns:
             Registration result
         """
-        # Check if this is the first admin (no authorization needed)
-        has_admin = AdminModel.has_any_registered_admin()
-        
-        if has_admin:
-            # Only super_admin can register new admins
-            # This check should be done at route level with session verification
-            pass
+        # Authorization (first admin vs. super_admin) is checked at route level
         
         # Register face
         face_result = self.face_service.register_face(admin_id, images)
@@ -118,8 +128,9 @@ class AdminAuthService:
         import secrets
         session_token = secrets.token_urlsafe(32)
         
-        # Store session
-        self._active_sessions[session_token] = (admin_id, time.time())
+        # Store session, dropping expired ones so the table stays bounded
+        self._prune_expired_sessions()
+        self._active_sessions[_session_key(session_token)] = (admin_id, time.time(), admin.get('name'), admin.get('role'))
         
         # Log activity
         AdminModel.log_activity(
@@ -156,50 +167,50 @@ class AdminAuthService:
                 "message": "No session token provided"
             }
         
-        if session_token not in self._active_sessions:
+        key = _session_key(session_token) if _is_well_formed_token(session_token) else None
+        session = self._active_sessions.get(key) if key else None
+        if session is None:
             return {
                 "valid": False,
                 "message": "Invalid session token"
             }
         
-        admin_id, timestamp = self._active_sessions[session_token]
+        admin_id, timestamp, name, role = session
         
         # Check if session has expired
         if time.time() - timestamp > AdminConfig.ADMIN_SESSION_TIMEOUT:
-            del self._active_sessions[session_token]
+            self._active_sessions.pop(key, None)
             return {
                 "valid": False,
                 "message": "Session expired. Please re-authenticate."
             }
         
-        # Get admin details
-        admin = AdminModel.get_by_admin_id(admin_id)
-        
         return {
             "valid": True,
             "admin_id": admin_id,
-            "name": admin.get('name') if admin else None,
-            "role": admin.get('role') if admin else None,
+            "name": name,
+            "role": role,
             "remaining_time": int(AdminConfig.ADMIN_SESSION_TIMEOUT - (time.time() - timestamp))
         }
     
     def invalidate_session(self, session_token: str) -> bool:
         """Invalidate an admin session (logout)"""
-        if session_token in self._active_sessions:
-            del self._active_sessions[session_token]
-            return True
+        if _is_well_formed_token(session_token):
+            return self._active_sessions.pop(_session_key(session_token), None) is not None
         return False
     
     def extend_session(self, session_token: str) -> Dict[str, Any]:
         """Extend an active session"""
-        if session_token not in self._active_sessions:
+        key = _session_key(session_token) if _is_well_formed_token(session_token) else None
+        session = self._active_sessions.get(key) if key else None
+        if session is None:
             return {
                 "success": False,
                 "message": "Invalid session token"
             }
         
-        admin_id, _ = self._active_sessions[session_token]
-        self._active_sessions[session_token] = (admin_id, time.time())
+        admin_id, _, name, role = session
+        self._active_sessions[key] = (admin_id, time.time(), name, role)
         
         return {
             "success": True,
@@ -207,6 +218,13 @@ class AdminAuthService:
             "expires_in": AdminConfig.ADMIN_SESSION_TIMEOUT
         }
     
+    def _prune_expired_sessions(self) -> None:
+        """Remove sessions past ADMIN_SESSION_TIMEOUT"""
+        cutoff = time.time() - AdminConfig.ADMIN_SESSION_TIMEOUT
+        for key, session in list(self._active_sessions.items()):
+            if session[1] < cutoff:
+                self._active_sessions.pop(key, None)
+    
     def is_first_admin(self) -> bool:
         """Check if this would be the first admin (no auth required)"""
         return not AdminModel.has_any_registered_admin()
@@ -224,6 +242,11 @@ class AdminAuthService:
         success = AdminModel.deactivate(admin_id)
         
         if success:
+            # End the admin's sessions; verify_session no longer consults the database
+            for key, session in list(self._active_sessions.items()):
+                if session[0] == admin_id:
+                    self._active_sessions.pop(key, None)
+            
             # Log activity
             AdminModel.log_activity(
                 admin_id=deactivated_by,
@@ -246,9 +269,9 @@ class AdminAuthService:
             details={"employee_name": employee_name}
         )
     
-    def get_activity_log(self, admin_id: str = None, limit: int = 50) -> list:
+    def get_activity_log(self, admin_id: str = None, limit: int = 50, before: str = None) -> list:
         """Get admin activity log"""
-        return AdminModel.get_activity_log(admin_id, limit)
+        return AdminModel.get_activity_log(admin_id, limit, before)
 
 
 # Singleton instance
@@ -3,11 +3,38 @@ Anti-Spoofing Service
 Detects presentation attacks (photos, videos, masks)
 Optimized for speed with configurable settings
 """
+import threading
 import cv2
 import numpy as np
-from scipy.spatial import distance as dist
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from config import Config
+from utils.helpers import map_images
+
+
+# Landmark index pairs for EAR: (p2, p6), (p3, p5), (p1, p4) of one eye, and
+# the same pairs for both eyes stacked as a (12, 2) array
+_EAR_FROM = np.array([1, 2, 0], dtype=np.intp)
+_EAR_TO = np.array([5, 4, 3], dtype=np.intp)
+_EAR_BOTH_FROM = np.concatenate((_EAR_FROM, _EAR_FROM + 6))
+_EAR_BOTH_TO = np.concatenate((_EAR_TO, _EAR_TO + 6))
+
+# Per-thread RGB conversion buffer, reused across blink frames of the same size
+_rgb_buffers = threading.local()
+
+
+def _to_rgb(frame: np.ndarray) -> np.ndarray:
+    """Convert a BGR frame to RGB into this thread's reusable buffer"""
+    buffer = getattr(_rgb_buffers, 'rgb', None)
+    if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+        buffer = _rgb_buffers.rgb = np.empty_like(frame)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffer)
+
+
+def _has_blink_pattern(ear: np.ndarray, threshold: float) -> bool:
+    """True if some EAR dips below threshold with open eyes on both sides"""
+    below = ear < threshold
+    above = ear > threshold
+    return bool(np.any(below[1:-1] & above[:-2] & above[2:]))
 
 
 class AntiSpoofingService:
@@ -32,28 +59,39 @@ class AntiSpoofingService:
         self.texture_threshold = Config.SPOOF_TEXTURE_THRESHOLD
         self.quick_mode = Config.SPOOF_QUICK_MODE
         self.frame_count = Config.SPOOF_FRAME_COUNT
-        
-        # Load face detector (fast Haar cascade)
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
+        self.analysis_scale = Config.SPOOF_ANALYSIS_SCALE
+    
+    # Frames narrower than this (after scaling) are analysed at full size
+    MIN_ANALYSIS_WIDTH = 320
+    
+    def _downscale(self, gray: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Shrink a grayscale frame for analysis; returns (frame, scale applied)"""
+        scale = self.analysis_scale
+        if scale >= 1.0 or gray.shape[1] * scale < self.MIN_ANALYSIS_WIDTH:
+            return gray, 1.0
+        return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
     
     def eye_aspect_ratio(self, eye_points: np.ndarray) -> float:
         """
         Calculate eye aspect ratio for blink detection
         EAR = (||p2-p6|| + ||p3-p5||) / (2 * ||p1-p4||)
         """
-        # Compute euclidean distances between vertical eye landmarks
-        A = dist.euclidean(eye_points[1], eye_points[5])
-        B = dist.euclidean(eye_points[2], eye_points[4])
-        
-        # Compute euclidean distance between horizontal eye landmarks
-        C = dist.euclidean(eye_points[0], eye_points[3])
+        # Vertical (p2-p6, p3-p5) and horizontal (p1-p4) distances in one call
+        A, B, C = np.linalg.norm(eye_points[_EAR_FROM] - eye_points[_EAR_TO], axis=1)
         
         # Compute eye aspect ratio
         ear = (A + B) / (2.0 * C) if C != 0 else 0
         return ear
     
+    @staticmethod
+    def _mean_eye_aspect_ratio(left_eye: np.ndarray, right_eye: np.ndarray) -> float:
+        """Average EAR of both eyes, with all six distances in one NumPy call"""
+        eyes = np.concatenate((left_eye, right_eye)).astype(np.float64)
+        d = np.linalg.norm(eyes[_EAR_BOTH_FROM] - eyes[_EAR_BOTH_TO], axis=1)
+        left_ear = (d[0] + d[1]) / (2.0 * d[2]) if d[2] != 0 else 0
+        right_ear = (d[3] + d[4]) / (2.0 * d[5]) if d[5] != 0 else 0
+        return float(left_ear + right_ear) / 2.0
+    
     def detect_blink(self, frames: List[np.ndarray]) -> Dict[str, Any]:
         """
         Detect if a blink occurred across multiple frames
@@ -75,20 +113,14 @@ class AntiSpoofingService:
         
         import face_recognition
         
-        ear_values = []
-        
-        # Only check every other frame for speed
-        for i, frame in enumerate(frames):
-            if i % 2 != 0:
-                continue
-                
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        def frame_ear(frame: np.ndarray) -> Optional[float]:
+            rgb_frame = _to_rgb(frame)
             
             # Get facial landmarks
             face_landmarks_list = face_recognition.face_landmarks(rgb_frame)
             
             if not face_landmarks_list:
-                continue
+                return None
             
             landmarks = face_landmarks_list[0]
             
@@ -96,13 +128,12 @@ class AntiSpoofingService:
             left_eye = np.array(landmarks['left_eye'])
             right_eye = np.array(landmarks['right_eye'])
             
-            # Calculate EAR for both eyes
-            left_ear = self.eye_aspect_ratio(left_eye)
-            right_ear = self.eye_aspect_ratio(right_eye)
-            
-            # Average EAR
-            ear = (left_ear + right_ear) / 2.0
-            ear_values.append(ear)
+            # Average EAR of both eyes
+            return self._mean_eye_aspect_ratio(left_eye, right_eye)
+        
+        # Only check every other frame for speed; dlib releases the GIL,
+        # so landmark detection runs on several frames at once
+        ear_values = [ear for ear in map_images(frame_ear, frames[::2]) if ear is not None]
         
         if len(ear_values) < 3:
             return {
@@ -112,13 +143,7 @@ class AntiSpoofingService:
             }
         
         # Check for blink pattern (EAR drops below threshold then rises)
-        blink_detected = False
-        for i in range(1, len(ear_values) - 1):
-            if (ear_values[i] < self.EYE_AR_THRESH and 
-                ear_values[i-1] > self.EYE_AR_THRESH and 
-                ear_values[i+1] > self.EYE_AR_THRESH):
-                blink_detected = True
-                break
+        blink_detected = _has_blink_pattern(np.asarray(ear_values, dtype=np.float64), self.EYE_AR_THRESH)
         
         return {
             "success": True,
@@ -127,39 +152,37 @@ class AntiSpoofingService:
             "message": "Blink detected - Liveness confirmed" if blink_detected else "No blink detected"
         }
     
-    def analyze_texture(self, image: np.ndarray) -> Dict[str, Any]:
+    def analyze_texture(self, image: np.ndarray, gray: np.ndarray = None) -> Dict[str, Any]:
         """
         Analyze image texture to detect printed photos or screens
         Uses Laplacian variance analysis (fast method)
         
         Args:
             image: BGR image
+            gray: Grayscale version of image, if already computed
         
         Returns:
             Dictionary with is_real boolean and confidence
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Detect face region (using fast Haar cascade)
-        faces = self.face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.2,  # Faster with larger scale
-            minNeighbors=3,
-            minSize=(50, 50)
-        )
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
-        if len(faces) == 0:
-            # If no face detected, analyze the whole image
-            face_roi = gray
-        else:
-            x, y, w, h = faces[0]
-            face_roi = gray[y:y+h, x:x+w]
+        # Analyze the central 60% of the frame, where the user faces the camera;
+        # the variances do not depend on exact face bounds, so a cascade
+        # search is not worth its cost here
+        h, w = gray.shape
+        y0, x0 = h // 5, w // 5
+        face_roi = gray[y0:h-y0, x0:w-x0]
         
         # Calculate Laplacian variance (blur/sharpness detection) - FAST
-        laplacian_var = cv2.Laplacian(face_roi, cv2.CV_64F).var()
+        # cv2.meanStdDev makes one pass with no float64 temporaries, unlike
+        # ndarray.var(), and reads the ROI view without copying it.
+        # The 3x3 Laplacian of 8-bit input lies within +/-1020, so int16
+        # holds it exactly at a quarter of the memory traffic of float64
+        laplacian_var = float(cv2.meanStdDev(cv2.Laplacian(face_roi, cv2.CV_16S))[1][0, 0]) ** 2
         
         # Calculate simple texture variance - FAST
-        texture_var = np.var(face_roi)
+        texture_var = float(cv2.meanStdDev(face_roi)[1][0, 0]) ** 2
         
         # Use configurable thresholds
         is_real = laplacian_var > self.laplacian_threshold or texture_var > self.texture_threshold
@@ -175,6 +198,21 @@ class AntiSpoofingService:
             "message": "Real face detected" if is_real else "Possible spoof detected"
         }
     
+    def _motion_frame(self, gray: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Downscaled, smoothed grayscale frame for motion comparison, and its scale"""
+        gray, scale = self._downscale(gray)
+        # Box blur with about the spread of the old 21x21 Gaussian (sigma ~3.5);
+        # cv2.blur costs the same per pixel whatever the kernel size.
+        # The kernel (like the caller's pixel threshold) shrinks with the frame
+        kernel = max(3, int(11 * scale) | 1)
+        return cv2.blur(gray, (kernel, kernel)), scale
+    
+    @staticmethod
+    def _count_motion_pixels(prev_frame: np.ndarray, frame: np.ndarray) -> int:
+        """Count pixels that changed by more than 25 levels"""
+        # Both frames are small, contiguous uint8 arrays fresh from cv2.blur
+        return int(np.count_nonzero(cv2.absdiff(prev_frame, frame) > 25))
+    
     def detect_motion(self, current_frame: np.ndarray) -> Dict[str, Any]:
         """
         Detect motion between frames (static images don't have motion)
@@ -185,8 +223,7 @@ class AntiSpoofingService:
         Returns:
             Dictionary with motion_detected boolean
         """
-        gray = cv2.cvtColor(current_frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (21, 21), 0)
+        gray, scale = self._motion_frame(cv2.cvtColor(current_frame, cv2.COLOR_BGR2GRAY))
         
         if self.prev_frame is None:
             self.prev_frame = gray
@@ -196,14 +233,11 @@ class AntiSpoofingService:
                 "message": "First frame - no motion comparison"
             }
         
-        # Compute difference
-        frame_delta = cv2.absdiff(self.prev_frame, gray)
-        thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
-        motion_pixels = np.sum(thresh > 0)
+        motion_pixels = self._count_motion_pixels(self.prev_frame, gray)
         
         self.prev_frame = gray
         
-        motion_detected = motion_pixels > self.motion_threshold
+        motion_detected = motion_pixels > self.motion_threshold * scale * scale
         
         return {
             "success": True,
@@ -244,19 +278,41 @@ class AntiSpoofingService:
             "overall_is_real": False
         }
         
+        # Convert each frame used below to grayscale once (the last one for
+        # texture, then every other frame for motion)
+        sampled = range(0, len(frames_to_check), 2)
+        last = len(frames_to_check) - 1
+        grays = {last: cv2.cvtColor(frames_to_check[last], cv2.COLOR_BGR2GRAY)}
+        
         # Quick texture check on last frame only
-        results["texture_check"] = self.analyze_texture(frames_to_check[-1])
+        results["texture_check"] = self.analyze_texture(frames_to_check[last], gray=grays[last])
         texture_real = results["texture_check"].get("is_real", False)
         
-        # Quick motion check (only check a few frames)
-        self.reset_motion_detector()
+        # A real texture already decides the outcome (texture OR motion), so
+        # a confident one skips the motion frames entirely
+        texture_confidence = results["texture_check"].get("confidence", 0)
+        if texture_real and texture_confidence >= Config.SPOOF_FAST_PASS_CONFIDENCE:
+            results["overall_is_real"] = True
+            results["confidence"] = texture_confidence
+            results["message"] = "Liveness verification passed"
+            return results
+        
+        for i in sampled:
+            if i not in grays:
+                grays[i] = cv2.cvtColor(frames_to_check[i], cv2.COLOR_BGR2GRAY)
+        
+        # Quick motion check (only check a few frames); the previous frame is
+        # kept locally so concurrent requests do not share detector state
         motion_count = 0
+        prev_frame = None
         
         # Check every other frame for speed
-        for i in range(0, len(frames_to_check), 2):
-            motion_result = self.detect_motion(frames_to_check[i])
-            if motion_result.get("motion_detected"):
+        for i in sampled:
+            frame, scale = self._motion_frame(grays[i])
+            if (prev_frame is not None and
+                    self._count_motion_pixels(prev_frame, frame) > self.motion_threshold * scale * scale):
                 motion_count += 1
+            prev_frame = frame
         
         results["motion_count"] = motion_count
         has_motion = motion_count >= 1  # Just need 1 motion detection
@@ -292,3 +348,15 @@ class AntiSpoofingService:
             Dictionary with is_real result
         """
         return self.analyze_texture(image)
+
+
+# Singleton instance
+_antispoof_service: Optional[AntiSpoofingService] = None
+
+
+def get_antispoof_service() -> AntiSpoofingService:
+    """Get or create AntiSpoofingService singleton"""
+    global _antispoof_service
+    if _antispoof_service is None:
+        _antispoof_service = AntiSpoofingService()
+    return _antispoof_service
@@ -6,11 +6,254 @@ Optimized for speed with YOLO detection
 import cv2
 import numpy as np
 import face_recognition
+import json
+import logging
 import pickle
 import os
+import threading
+import uuid
+from contextlib import contextmanager
 from typing import Tuple, List, Optional, Dict, Any
 from config import Config
 
+try:
+    import faiss
+except ImportError:  # optional: index for large galleries
+    faiss = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process servers only, no cross-process lock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def dlib_uses_simd() -> bool:
+    """Check whether the installed dlib was compiled with AVX or NEON instructions"""
+    try:
+        import dlib
+    except ImportError:
+        return False
+    return bool(
+        getattr(dlib, 'DLIB_USE_AVX_INSTRUCTIONS', False) or
+        getattr(dlib, 'DLIB_USE_NEON_INSTRUCTIONS', False)
+    )
+
+
+# Encodings are stored per directory as one (N, 128) float32 matrix file
+# (encodings-<generation>.npy) plus a JSON manifest naming that file and
+# listing the matching person IDs. Replacing the manifest commits a write,
+# so readers never see IDs and rows out of step. Writers hold an exclusive
+# lock on _LOCK_FILE and readers a shared one. The older layout (a plain ID
+# list next to encodings.npy) and per-person .pkl files are still read and
+# migrated on load
+ENCODINGS_FILE = 'encodings.npy'
+ENCODING_IDS_FILE = 'encoding_ids.json'
+_MATRIX_PREFIX = 'encodings-'
+_LOCK_FILE = '.encodings.lock'
+_LEGACY_SUFFIX = '.pkl'
+
+
+class EncodingStoreError(Exception):
+    """The encoding store exists but cannot be read"""
+
+
+def _empty_encodings() -> np.ndarray:
+    return np.empty((0, 128), dtype=np.float32)
+
+
+class QuantizedEncodings:
+    """
+    int8 copy of an encodings matrix used to shortlist nearest neighbours
+    
+    One scale/offset is shared by all dimensions so integer distances rank
+    candidates the same way as float distances (up to rounding).
+    """
+    
+    # Candidates re-ranked at full precision
+    TOP_K = 5
+    # Rows scanned per block, so each block's int16 differences (128 KB)
+    # stay in L2 cache between the subtract and the reduction
+    BLOCK_ROWS = 512
+    
+    def __init__(self, matrix: np.ndarray):
+        self.source = matrix
+        low, high = float(matrix.min()), float(matrix.max())
+        self.offset = (low + high) / 2
+        self.scale = max(high - low, 1e-6) / 254
+        self.codes = self._quantize(matrix)
+    
+    def _quantize(self, values: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((values - self.offset) / self.scale), -127, 127).astype(np.int8)
+    
+    def nearest(self, encoding: np.ndarray) -> Tuple[int, float]:
+        """Index of and float distance to the closest encoding"""
+        query = self._quantize(encoding).astype(np.int16)
+        approx = np.empty(len(self.codes), dtype=np.int32)
+        for start in range(0, len(self.codes), self.BLOCK_ROWS):
+            stop = start + self.BLOCK_ROWS
+            diff = self.codes[start:stop].astype(np.int16) - query
+            np.einsum('ij,ij->i', diff, diff, dtype=np.int32, out=approx[start:stop])
+        
+        k = min(self.TOP_K, len(approx))
+        candidates = np.argpartition(approx, k - 1)[:k]
+        distances = np.linalg.norm(self.source[candidates] - encoding, axis=1)
+        best = int(np.argmin(distances))
+        return int(candidates[best]), float(distances[best])
+
+
+class FaissEncodings:
+    """Exact L2 nearest-neighbour search over an encodings matrix with FAISS"""
+    
+    def __init__(self, matrix: np.ndarray):
+        self.source = matrix
+        self.index = faiss.IndexFlatL2(matrix.shape[1])
+        self.index.add(np.ascontiguousarray(matrix, dtype=np.float32))
+    
+    def nearest(self, encoding: np.ndarray) -> Tuple[int, float]:
+        """Index of and distance to the closest encoding"""
+        query = np.ascontiguousarray(encoding, dtype=np.float32).reshape(1, -1)
+        squared, indices = self.index.search(query, 1)
+        return int(indices[0, 0]), float(np.sqrt(squared[0, 0]))
+
+
+def row_norms(matrix: np.ndarray) -> np.ndarray:
+    """Squared L2 norm of every row of matrix"""
+    return np.einsum('ij,ij->i', matrix, matrix)
+
+
+def squared_distances(matrix: np.ndarray, encoding: np.ndarray,
+                      norms: np.ndarray = None) -> np.ndarray:
+    """
+    Squared L2 distance from encoding to every row of matrix
+    
+    Expands ||m - q||^2 = ||m||^2 + ||q||^2 - 2 m.q so the sweep is one BLAS
+    matrix-vector product; no (N, 128) difference array is allocated.
+    Pass precomputed row_norms(matrix) to skip the norm reduction.
+    """
+    if norms is None:
+        norms = row_norms(matrix)
+    query = np.asarray(encoding, dtype=matrix.dtype)
+    return norms + query.dot(query) - 2 * (matrix @ query)
+
+
+@contextmanager
+def encoding_store_lock(directory: str, exclusive: bool = True):
+    """Hold the store's cross-process lock (exclusive for writers, shared for readers)"""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, _LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def encoding_store_signature(directory: str) -> Optional[tuple]:
+    """(file name, inode, mtime_ns) of every encoding file in directory, or None if unreadable"""
+    try:
+        return tuple(sorted(
+            (entry.name, entry.inode(), entry.stat().st_mtime_ns)
+            for entry in os.scandir(directory)
+            if entry.name in (ENCODINGS_FILE, ENCODING_IDS_FILE) or entry.name.endswith(_LEGACY_SUFFIX)
+        ))
+    except OSError:
+        return None
+
+
+def read_encoding_store(directory: str) -> Tuple[List[str], np.ndarray]:
+    """
+    Read the encodings saved in directory (under the store's shared lock)
+    
+    The matrix file is memory-mapped, so rows are read from the page cache
+    on demand and shared between worker processes. Legacy .pkl encodings
+    not in the matrix are appended. An unreadable store is logged and
+    skipped, leaving only the legacy encodings.
+    
+    Returns:
+        Parallel list of person IDs and (N, 128) float32 matrix
+    """
+    with encoding_store_lock(directory, exclusive=False):
+        try:
+            return _read_encoding_store(directory)
+        except EncodingStoreError as e:
+            logger.error("%s", e)
+            return _read_encoding_store(directory, include_store=False)
+
+
+def _read_encoding_store(directory: str, include_store: bool = True) -> Tuple[List[str], np.ndarray]:
+    """read_encoding_store without locking; raises EncodingStoreError if the store is unreadable"""
+    ids: List[str] = []
+    matrix = _empty_encodings()
+    
+    ids_path = os.path.join(directory, ENCODING_IDS_FILE)
+    if include_store and os.path.exists(ids_path):
+        try:
+            with open(ids_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if isinstance(manifest, list):
+                stored_ids, matrix_file = manifest, ENCODINGS_FILE
+            else:
+                stored_ids, matrix_file = manifest['ids'], manifest['matrix']
+            stored = np.load(os.path.join(directory, matrix_file), mmap_mode='r')
+        except Exception as e:
+            raise EncodingStoreError(f"Error loading encodings from {directory}: {e}") from e
+        if len(stored_ids) != stored.shape[0]:
+            raise EncodingStoreError(f"Encoding store in {directory} is inconsistent; ignoring it")
+        ids, matrix = list(stored_ids), stored
+    
+    known = set(ids)
+    legacy_ids = []
+    legacy_encodings = []
+    for filename in sorted(os.listdir(directory)):
+        person_id = filename[:-len(_LEGACY_SUFFIX)]
+        if not filename.endswith(_LEGACY_SUFFIX) or person_id in known:
+            continue
+        try:
+            with open(os.path.join(directory, filename), 'rb') as f:
+                legacy_encodings.append(np.asarray(pickle.load(f), dtype=np.float32))
+            legacy_ids.append(person_id)
+        except Exception as e:
+            logger.warning("Error loading encoding for %s: %s", person_id, e)
+    
+    if legacy_ids:
+        ids = ids + legacy_ids
+        matrix = np.vstack([matrix, np.array(legacy_encodings)])
+    return ids, matrix
+
+
+def write_encoding_store(directory: str, ids: List[str], matrix: np.ndarray) -> None:
+    """
+    Atomically replace the encodings saved in directory
+    
+    Callers must hold encoding_store_lock(directory). The matrix goes to a
+    new generation file and the manifest is replaced last, so a crash at
+    any point leaves either the old or the new store intact. Superseded
+    matrix files are then removed (processes still mapping them keep
+    their view).
+    """
+    matrix_file = f"{_MATRIX_PREFIX}{uuid.uuid4().hex[:12]}.npy"
+    with open(os.path.join(directory, matrix_file), 'wb') as f:
+        np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+    
+    ids_path = os.path.join(directory, ENCODING_IDS_FILE)
+    with open(ids_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({"matrix": matrix_file, "ids": ids}, f)
+    os.replace(ids_path + '.tmp', ids_path)
+    
+    for filename in os.listdir(directory):
+        superseded = filename == ENCODINGS_FILE or (
+            filename.startswith(_MATRIX_PREFIX) and filename.endswith('.npy')
+        )
+        if superseded and filename != matrix_file:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass  # still mapped on Windows; removed by a later write
+
 
 class FaceRecognitionService:
     """
@@ -30,10 +273,38 @@ class FaceRecognitionService:
         self.encodings_dir = encodings_dir or Config.FACE_ENCODINGS_DIR
         self.tolerance = tolerance or Config.FACE_RECOGNITION_TOLERANCE
         self.detection_model = Config.FACE_DETECTION_MODEL
-        self.num_jitters = Config.FACE_NUM_JITTERS
+        self.register_jitters = Config.FACE_NUM_JITTERS_REGISTER
+        self.recognize_jitters = Config.FACE_NUM_JITTERS_RECOGNIZE
+        self.landmark_model = Config.FACE_LANDMARK_MODEL
         self.scale_factor = Config.IMAGE_SCALE_FACTOR
         self.known_face_encodings: Dict[str, np.ndarray] = {}
         
+        # known_face_encodings stacked as (ids, (N, 128) matrix) for vectorized
+        # matching. The matrix is a view of the first N rows of a buffer that
+        # doubles when full, so registering appends a row instead of restacking;
+        # _encoding_rows maps each ID to its row. Changes are made under
+        # _encodings_lock and never touch rows or IDs an already published
+        # snapshot can see, so readers can match against one without locking
+        self._encodings_lock = threading.Lock()
+        self._stacked_encodings: Tuple[List[str], np.ndarray] = ([], _empty_encodings())
+        self._encoding_buffer = _empty_encodings()
+        self._encoding_rows: Dict[str, int] = {}
+        # Signature of the store as last read or written by this process; a
+        # different one on disk means another worker has written since
+        self._store_signature: Optional[tuple] = None
+        
+        # Admin encodings read from ADMIN_ENCODINGS_DIR, as (directory
+        # signature, ids, matrix); reloaded when any encoding file changes
+        self._admin_encodings: Optional[Tuple[tuple, List[str], np.ndarray]] = None
+        # Users and admins stacked together, keyed by the two source matrices
+        # (each cache replaces its matrix whenever that side changes)
+        self._combined_encodings: Optional[Tuple[tuple, List[str], np.ndarray]] = None
+        # Search index for large matrices (see FACE_INDEX_MIN_ENCODINGS)
+        self._encoding_index = None
+        # Squared row norms of the last matrices matched against, as
+        # (matrix, norms) pairs, most recent first (users only / users + admins)
+        self._matrix_norms: List[Tuple[np.ndarray, np.ndarray]] = []
+        
         # Initialize fast detector
         self._fast_detector = None
         
@@ -52,30 +323,168 @@ class FaceRecognitionService:
         return self._fast_detector
     
     def _load_all_encodings(self):
-        """Load all saved face encodings from disk"""
-        for filename in os.listdir(self.encodings_dir):
-            if filename.endswith('.pkl'):
-                person_id = filename[:-4]
-                filepath = os.path.join(self.encodings_dir, filename)
-                try:
-                    with open(filepath, 'rb') as f:
-                        self.known_face_encodings[person_id] = pickle.load(f)
-                except Exception as e:
-                    print(f"Error loading encoding for {person_id}: {e}")
+        """Load all saved face encodings from disk, migrating legacy .pkl files"""
+        with self._encodings_lock, encoding_store_lock(self.encodings_dir):
+            try:
+                self._reload_encodings()
+            except EncodingStoreError as e:
+                # Serve the legacy encodings only; saving stays refused (see
+                # _sync_encodings) so the damaged store is never overwritten
+                logger.error("%s", e)
+                self._set_encodings(*_read_encoding_store(self.encodings_dir, include_store=False))
+                return
+            
+            legacy_files = [f for f in os.listdir(self.encodings_dir) if f.endswith(_LEGACY_SUFFIX)]
+            if legacy_files:
+                self._write_encodings()
+                for filename in legacy_files:
+                    os.remove(os.path.join(self.encodings_dir, filename))
+                self._store_signature = encoding_store_signature(self.encodings_dir)
+    
+    def _set_encodings(self, ids: List[str], matrix: np.ndarray):
+        """Replace the in-memory encodings"""
+        self.known_face_encodings = dict(zip(ids, matrix))
+        # The loaded matrix is a read-only memory map; it is copied on the first change
+        self._encoding_buffer = matrix
+        self._encoding_rows = {person_id: row for row, person_id in enumerate(ids)}
+        self._stacked_encodings = (ids, matrix)
+    
+    def _reload_encodings(self):
+        """Re-read the store (caller holds its lock); raises EncodingStoreError if unreadable"""
+        self._set_encodings(*_read_encoding_store(self.encodings_dir))
+        self._store_signature = encoding_store_signature(self.encodings_dir)
+    
+    def _sync_encodings(self):
+        """Re-read the store if another process wrote it since this one (caller holds its lock)"""
+        if encoding_store_signature(self.encodings_dir) != self._store_signature:
+            self._reload_encodings()
+    
+    def _stacked_known_encodings(self) -> Tuple[List[str], np.ndarray]:
+        """Snapshot of the known encodings as parallel ID list and (N, 128) matrix"""
+        with self._encodings_lock:
+            return self._stacked_encodings
+    
+    def _set_stacked_encoding(self, person_id: str, encoding: np.ndarray):
+        """
+        Overwrite or append one row of the stacked matrix (caller holds _encodings_lock)
+        
+        Appending writes past the end of every published matrix view, so it
+        is amortized O(1); overwriting a row copies the buffer first.
+        """
+        ids, _ = self._stacked_encodings
+        count = len(ids)
+        row = self._encoding_rows.get(person_id)
+        needed = count + 1 if row is None else count
+        
+        buffer = self._encoding_buffer
+        if needed > len(buffer) or row is not None or not buffer.flags.writeable:
+            grown = np.empty((max(16, 2 * needed), 128), dtype=np.float32)
+            grown[:count] = buffer[:count]
+            buffer = self._encoding_buffer = grown
+        
+        if row is None:
+            row = count
+            # New list, so a snapshot's IDs always match its matrix rows
+            ids = ids + [person_id]
+            self._encoding_rows[person_id] = row
+        buffer[row] = encoding
+        
+        # A new view object, so caches keyed by matrix identity are rebuilt
+        self._stacked_encodings = (ids, buffer[:needed])
+    
+    def _remove_stacked_encoding(self, person_id: str):
+        """
+        Remove one row of the stacked matrix by moving the last row into its place
+        (caller holds _encodings_lock)
+        
+        Works on copies so a match already running against the previous
+        snapshot never sees a row relabelled under it.
+        """
+        row = self._encoding_rows.pop(person_id, None)
+        if row is None:
+            return
+        
+        ids, _ = self._stacked_encodings
+        ids = list(ids)
+        buffer = np.array(self._encoding_buffer, dtype=np.float32)
+        last = len(ids) - 1
+        if row != last:
+            buffer[row] = buffer[last]
+            ids[row] = ids[last]
+            self._encoding_rows[ids[row]] = row
+        ids.pop()
+        
+        self._encoding_buffer = buffer
+        self._stacked_encodings = (ids, buffer[:last])
+    
+    def _admin_encodings_matrix(self) -> Tuple[List[str], np.ndarray]:
+        """Admin encodings as parallel ID list and (N, 128) matrix, cached by file mtimes"""
+        admin_dir = Config.ADMIN_ENCODINGS_DIR
+        signature = encoding_store_signature(admin_dir)
+        if signature is None:
+            return [], _empty_encodings()
+        
+        cached = self._admin_encodings
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+        
+        admin_ids, matrix = read_encoding_store(admin_dir)
+        self._admin_encodings = (signature, admin_ids, matrix)
+        return admin_ids, matrix
+    
+    def _combine_encodings(self, ids: List[str], matrix: np.ndarray, admin_ids: List[str],
+                           admin_matrix: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """User and admin encodings stacked together, rebuilt only when either side changes"""
+        combined = self._combined_encodings
+        if combined is None or combined[0][0] is not matrix or combined[0][1] is not admin_matrix:
+            combined = ((matrix, admin_matrix), ids + admin_ids, np.vstack([matrix, admin_matrix]))
+            self._combined_encodings = combined
+        return combined[1], combined[2]
+    
+    def _row_norms(self, matrix: np.ndarray) -> np.ndarray:
+        """Squared row norms of matrix, computed once per matrix"""
+        for cached_matrix, norms in self._matrix_norms:
+            if cached_matrix is matrix:
+                return norms
+        norms = row_norms(matrix)
+        self._matrix_norms = [(matrix, norms)] + self._matrix_norms[:1]
+        return norms
+    
+    def _nearest_encoding(self, matrix: np.ndarray, encoding: np.ndarray) -> Tuple[int, float]:
+        """Index of and distance to the closest row of matrix"""
+        if len(matrix) >= Config.FACE_INDEX_MIN_ENCODINGS:
+            index = self._encoding_index
+            if index is None or index.source is not matrix:
+                index_class = FaissEncodings if faiss is not None else QuantizedEncodings
+                index = self._encoding_index = index_class(matrix)
+            return index.nearest(encoding)
+        
+        best_index = int(np.argmin(squared_distances(matrix, encoding, self._row_norms(matrix))))
+        # Exact distance for the winner (the expansion loses a little precision)
+        return best_index, float(np.linalg.norm(matrix[best_index] - encoding))
+    
+    def _write_encodings(self):
+        """Write all known encodings to the store (caller holds _encodings_lock and the store lock)"""
+        ids, matrix = self._stacked_encodings
+        write_encoding_store(self.encodings_dir, ids, matrix)
+        self._store_signature = encoding_store_signature(self.encodings_dir)
     
     def _save_encoding(self, person_id: str, encoding: np.ndarray):
-        """Save face encoding to disk"""
-        filepath = os.path.join(self.encodings_dir, f"{person_id}.pkl")
-        with open(filepath, 'wb') as f:
-            pickle.dump(encoding, f)
+        """Save face encoding to disk, keeping encodings other workers saved"""
+        encoding = np.asarray(encoding, dtype=np.float32)
+        with self._encodings_lock, encoding_store_lock(self.encodings_dir):
+            self._sync_encodings()
+            self.known_face_encodings[person_id] = encoding
+            self._set_stacked_encoding(person_id, encoding)
+            self._write_encodings()
     
     def _delete_encoding(self, person_id: str):
-        """Delete face encoding from disk"""
-        filepath = os.path.join(self.encodings_dir, f"{person_id}.pkl")
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        if person_id in self.known_face_encodings:
-            del self.known_face_encodings[person_id]
+        """Delete face encoding from disk, keeping encodings other workers saved"""
+        with self._encodings_lock, encoding_store_lock(self.encodings_dir):
+            self._sync_encodings()
+            if self.known_face_encodings.pop(person_id, None) is not None:
+                self._remove_stacked_encoding(person_id)
+                self._write_encodings()
     
     def _resize_image(self, image: np.ndarray) -> Tuple[np.ndarray, float]:
         """Resize image for faster processing"""
@@ -89,12 +498,14 @@ class FaceRecognitionService:
         resized = cv2.resize(image, (new_width, new_height))
         return resized, self.scale_factor
     
-    def detect_faces(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    def detect_faces(self, image: np.ndarray,
+                     rgb_image: np.ndarray = None) -> List[Tuple[int, int, int, int]]:
         """
         Detect faces in an image using fast detection
         
         Args:
             image: BGR image (from OpenCV)
+            rgb_image: RGB version of image, if already converted
         
         Returns:
             List of face locations as (top, right, bottom, left)
@@ -104,7 +515,8 @@ class FaceRecognitionService:
             return self.fast_detector.detect_faces(image)
         else:
             # Fall back to face_recognition library (slower but more accurate)
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            if rgb_image is None:
+                rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
             return face_recognition.face_locations(rgb_image, model=self.detection_model)
     
     def detect_faces_fast(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
@@ -134,34 +546,101 @@ class FaceRecognitionService:
         
         return locations
     
+    @staticmethod
+    def _face_region(image: np.ndarray, face_location: Tuple) -> Tuple[np.ndarray, Tuple]:
+        """
+        Crop image around a face, with the location shifted into the crop
+        
+        The margin (half the face size per side) covers the padded, rotated
+        chip dlib aligns from the landmarks, so the encoding is unchanged.
+        """
+        top, right, bottom, left = face_location
+        margin_y = (bottom - top) // 2
+        margin_x = (right - left) // 2
+        y0 = max(0, top - margin_y)
+        x0 = max(0, left - margin_x)
+        y1 = min(image.shape[0], bottom + margin_y)
+        x1 = min(image.shape[1], right + margin_x)
+        return image[y0:y1, x0:x1], (top - y0, right - x0, bottom - y0, left - x0)
+    
     def get_face_encoding(self, image: np.ndarray, 
-                          face_location: Tuple = None) -> Optional[np.ndarray]:
+                          face_location: Tuple = None,
+                          rgb_image: np.ndarray = None,
+                          num_jitters: int = None) -> Optional[np.ndarray]:
         """
         Get face encoding from an image
         
         Args:
             image: BGR image
             face_location: Optional specific face location
+            rgb_image: RGB version of image, if already converted
+            num_jitters: Re-samples per face (default: the recognition setting)
         
         Returns:
             128-dimensional face encoding or None if no face found
         """
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if rgb_image is None:
+            if face_location:
+                # Only the region around the face is converted and handed to dlib
+                image, face_location = self._face_region(image, face_location)
+            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if num_jitters is None:
+            num_jitters = self.recognize_jitters
         
         if face_location:
             encodings = face_recognition.face_encodings(
                 rgb_image, 
                 [face_location],
-                num_jitters=self.num_jitters
+                num_jitters=num_jitters,
+                model=self.landmark_model
             )
         else:
             encodings = face_recognition.face_encodings(
                 rgb_image,
-                num_jitters=self.num_jitters
+                num_jitters=num_jitters,
+                model=self.landmark_model
             )
         
         return encodings[0] if encodings else None
     
+    def get_face_encodings(self, images: List[np.ndarray],
+                           face_locations: List[Tuple]) -> List[np.ndarray]:
+        """
+        Encode one known face per image with a single batched dlib call
+        
+        Falls back to one get_face_encoding call per image when the installed
+        dlib/face_recognition do not expose the batch descriptor API.
+        
+        Args:
+            images: BGR images
+            face_locations: Face location (top, right, bottom, left) for each image
+        
+        Returns:
+            128-dimensional encodings, in input order
+        """
+        rgb_images = [cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in images]
+        try:
+            import dlib
+            from face_recognition import api
+            
+            batch_faces = []
+            for rgb_image, location in zip(rgb_images, face_locations):
+                shapes = dlib.full_object_detections()
+                for shape in api._raw_face_landmarks(rgb_image, [location], self.landmark_model):
+                    shapes.append(shape)
+                batch_faces.append(shapes)
+            
+            descriptors = api.face_encoder.compute_face_descriptor(
+                rgb_images, batch_faces, self.register_jitters
+            )
+            return [np.array(faces[0]) for faces in descriptors]
+        except (ImportError, AttributeError, TypeError, IndexError, RuntimeError):
+            encodings = (
+                self.get_face_encoding(image, location, num_jitters=self.register_jitters)
+                for image, location in zip(images, face_locations)
+            )
+            return [encoding for encoding in encodings if encoding is not None]
+    
     def register_face(self, person_id: str, images: List[np.ndarray]) -> Dict[str, Any]:
         """
         Register a new face with multiple images for better accuracy
@@ -173,7 +652,8 @@ class FaceRecognitionService:
         Returns:
             Registration result with success status and message
         """
-        encodings = []
+        usable_images = []
+        usable_locations = []
         
         for image in images:
             face_locations = self.detect_faces(image)
@@ -183,9 +663,11 @@ class FaceRecognitionService:
             elif len(face_locations) > 1:
                 continue  # Skip images with multiple faces
             
-            encoding = self.get_face_encoding(image, face_locations[0])
-            if encoding is not None:
-                encodings.append(encoding)
+            usable_images.append(image)
+            usable_locations.append(face_locations[0])
+        
+        # Encode all usable images in one batch
+        encodings = self.get_face_encodings(usable_images, usable_locations) if usable_images else []
         
         if len(encodings) < 1:
             return {
@@ -197,7 +679,6 @@ class FaceRecognitionService:
         average_encoding = np.mean(encodings, axis=0)
         
         # Save encoding
-        self.known_face_encodings[person_id] = average_encoding
         self._save_encoding(person_id, average_encoding)
         
         return {
@@ -217,16 +698,22 @@ class FaceRecognitionService:
         Returns:
             Dictionary with person_id, confidence, and status
         """
+        # RGB copy for dlib, converted at most once per call
+        rgb_image = None
+        
         # Use fast detection
         face_locations = self.detect_faces_fast(image)
         
         if len(face_locations) == 0:
             # Try again with original size if scaled detection failed
-            face_locations = self.detect_faces(image)
+            if self.detection_model not in ['yolo', 'haar', 'fast']:
+                rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            face_locations = self.detect_faces(image, rgb_image)
         
         if len(face_locations) == 0:
             # Final fallback: use face_recognition library's HOG detector
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            if rgb_image is None:
+                rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
             face_locations = face_recognition.face_locations(rgb_image, model='hog')
             
         if len(face_locations) == 0:
@@ -243,7 +730,7 @@ class FaceRecognitionService:
                 "person_id": None
             }
         
-        encoding = self.get_face_encoding(image, face_locations[0])
+        encoding = self.get_face_encoding(image, face_locations[0], rgb_image)
         if encoding is None:
             return {
                 "success": False,
@@ -252,38 +739,24 @@ class FaceRecognitionService:
             }
         
         # Combine user encodings with admin encodings if requested
-        all_encodings = dict(self.known_face_encodings)
+        ids, matrix = self._stacked_known_encodings()
         
         if include_admins:
-            # Load admin encodings from admin directory
-            admin_dir = Config.ADMIN_ENCODINGS_DIR
-            if os.path.exists(admin_dir):
-                for filename in os.listdir(admin_dir):
-                    if filename.endswith('.pkl'):
-                        admin_id = filename[:-4]
-                        filepath = os.path.join(admin_dir, filename)
-                        try:
-                            with open(filepath, 'rb') as f:
-                                all_encodings[admin_id] = pickle.load(f)
-                        except Exception as e:
-                            print(f"Error loading admin encoding for {admin_id}: {e}")
-        
-        if not all_encodings:
+            # Admin encodings are only re-read from disk when their files change
+            admin_ids, admin_matrix = self._admin_encodings_matrix()
+            if admin_ids:
+                ids, matrix = self._combine_encodings(ids, matrix, admin_ids, admin_matrix)
+        
+        if not ids:
             return {
                 "success": False,
                 "message": "No registered faces in the system",
                 "person_id": None
             }
         
-        # Compare with all known faces (users and admins)
-        best_match_id = None
-        best_match_distance = float('inf')
-        
-        for pid, known_encoding in all_encodings.items():
-            distance = face_recognition.face_distance([known_encoding], encoding)[0]
-            if distance < best_match_distance:
-                best_match_distance = distance
-                best_match_id = pid
+        # Compare with all known faces (users and admins) in one vectorized pass
+        best_index, best_match_distance = self._nearest_encoding(matrix, encoding)
+        best_match_id = ids[best_index]
         
         # Convert distance to confidence (0-1, higher is better)
         confidence = 1 - best_match_distance
@@ -321,7 +794,8 @@ class FaceRecognitionService:
                 "message": f"No registered face for ID: {person_id}"
             }
         
-        face_locations = self.detect_faces(image)
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        face_locations = self.detect_faces(image, rgb_image)
         
         if len(face_locations) == 0:
             return {
@@ -330,7 +804,7 @@ class FaceRecognitionService:
                 "message": "No face detected"
             }
         
-        encoding = self.get_face_encoding(image, face_locations[0])
+        encoding = self.get_face_encoding(image, face_locations[0], rgb_image)
         if encoding is None:
             return {
                 "success": False,
@@ -363,3 +837,15 @@ class FaceRecognitionService:
     def is_registered(self, person_id: str) -> bool:
         """Check if a person is registered"""
         return person_id in self.known_face_encodings
+
+
+# Singleton instance (user encodings; admins use their own instance in AdminAuthService)
+_face_service: Optional[FaceRecognitionService] = None
+
+
+def get_face_service() -> FaceRecognitionService:
+    """Get or create FaceRecognitionService singleton"""
+    global _face_service
+    if _face_service is None:
+        _face_service = FaceRecognitionService()
+    return _face_service
@@ -2,8 +2,33 @@
 Image Preprocessor Service
 Handles image preprocessing for varying lighting conditions
 """
+import threading
+from functools import lru_cache
 import cv2
 import numpy as np
+from typing import Optional
+from config import Config
+
+
+# CLAHE objects keep per-call working buffers, so each thread gets its own
+_clahe_local = threading.local()
+
+
+def _get_clahe():
+    """This thread's CLAHE instance (created on first use)"""
+    clahe = getattr(_clahe_local, 'clahe', None)
+    if clahe is None:
+        clahe = _clahe_local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return clahe
+
+
+@lru_cache(maxsize=256)
+def _gamma_table(gamma: float) -> np.ndarray:
+    """256-entry lookup table for a gamma value (callers round it to 0.01)"""
+    table = (np.power(np.arange(256, dtype=np.float32) / 255.0, 1.0 / gamma) * 255).astype("uint8")
+    # Shared by every caller through the cache, so keep it immutable
+    table.flags.writeable = False
+    return table
 
 
 class ImagePreprocessor:
@@ -30,8 +55,7 @@ class ImagePreprocessor:
         l, a, b = cv2.split(lab)
         
         # Apply CLAHE to L channel
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        l_clahe = clahe.apply(l)
+        l_clahe = _get_clahe().apply(l)
         
         # Merge channels
         lab_clahe = cv2.merge([l_clahe, a, b])
@@ -53,13 +77,7 @@ class ImagePreprocessor:
         Returns:
             Gamma-adjusted image
         """
-        inv_gamma = 1.0 / gamma
-        table = np.array([
-            ((i / 255.0) ** inv_gamma) * 255
-            for i in np.arange(0, 256)
-        ]).astype("uint8")
-        
-        return cv2.LUT(image, table)
+        return cv2.LUT(image, _gamma_table(round(gamma, 2)))
     
     @staticmethod
     def auto_brightness(image: np.ndarray) -> np.ndarray:
@@ -73,7 +91,8 @@ class ImagePreprocessor:
             Brightness-adjusted image
         """
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        mean_brightness = np.mean(gray)
+        # cv2.mean is a single SIMD pass over the 8-bit image
+        mean_brightness = cv2.mean(gray)[0]
         
         # Target brightness
         target = 127
@@ -101,7 +120,8 @@ class ImagePreprocessor:
         Returns:
             Denoised image
         """
-        return cv2.fastNlMeansDenoisingColored(image, None, 10, 10, 7, 21)
+        # Bilateral filter: edge-preserving like non-local means at a fraction of the cost
+        return cv2.bilateralFilter(image, 5, 50, 50)
     
     @staticmethod
     def preprocess_for_recognition(image: np.ndarray) -> np.ndarray:
@@ -114,14 +134,18 @@ class ImagePreprocessor:
         Returns:
             Preprocessed image ready for face recognition
         """
+        # Downscale large camera frames first so every later step is cheaper
+        image = ImagePreprocessor.resize_for_processing(image, Config.MAX_IMAGE_DIMENSION)
+        
         # Auto brightness adjustment
         image = ImagePreprocessor.auto_brightness(image)
         
         # Normalize lighting
         image = ImagePreprocessor.normalize_lighting(image)
         
-        # Denoise
-        image = ImagePreprocessor.denoise(image)
+        # Denoise (optional)
+        if Config.DENOISE_ENABLED:
+            image = ImagePreprocessor.denoise(image)
         
         return image
     
@@ -150,3 +174,15 @@ class ImagePreprocessor:
             new_height = int(height * (max_size / width))
         
         return cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+
+# Singleton instance
+_preprocessor: Optional[ImagePreprocessor] = None
+
+
+def get_preprocessor() -> ImagePreprocessor:
+    """Get or create ImagePreprocessor singleton"""
+    global _preprocessor
+    if _preprocessor is None:
+        _preprocessor = ImagePreprocessor()
+    return _preprocessor
@@ -1,7 +1,9 @@
 """
 Fast Face Detector Service
-Uses OpenCV Haar Cascade (fastest) for face detection
+Uses OpenCV's YuNet DNN detector when its model file is present,
+otherwise Haar Cascades
 """
+import threading
 import cv2
 import numpy as np
 import os
@@ -39,8 +41,8 @@ def get_haar_cascade_path(cascade_name: str) -> str:
 
 class FastFaceDetector:
     """
-    Fast face detection using OpenCV Haar Cascade
-    This is the fastest method for face detection on CPU
+    Fast face detection on CPU: OpenCV YuNet when its model is available,
+    otherwise Haar Cascades
     """
     
     def __init__(self):
@@ -60,19 +62,65 @@ class FastFaceDetector:
             print(f"Warning: Could not load primary Haar cascade from {cascade_path}")
         if self.haar_alt.empty():
             print(f"Warning: Could not load alt Haar cascade from {alt_path}")
+        
+        # Preferred detector: YuNet (OpenCV DNN), one instance per thread
+        # because detect() depends on the input size set just before it
+        self.yunet_model_path = Config.YUNET_MODEL_PATH
+        self.yunet_available = hasattr(cv2, 'FaceDetectorYN') and os.path.exists(self.yunet_model_path)
+        self._yunet_local = threading.local()
+    
+    def _get_yunet(self):
+        """This thread's YuNet detector"""
+        detector = getattr(self._yunet_local, 'detector', None)
+        if detector is None:
+            detector = self._yunet_local.detector = cv2.FaceDetectorYN.create(
+                self.yunet_model_path, '', (320, 320), self.confidence_threshold
+            )
+        return detector
+    
+    def detect_faces_yunet(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """
+        Face detection using OpenCV's YuNet CNN
+        
+        Args:
+            image: BGR image
+            
+        Returns:
+            List of face locations as (top, right, bottom, left)
+        """
+        height, width = image.shape[:2]
+        detector = self._get_yunet()
+        detector.setInputSize((width, height))
+        _, faces = detector.detect(image)
+        
+        if faces is None:
+            return []
+        
+        face_locations = []
+        for face in faces:
+            x, y, w, h = (int(v) for v in face[:4])
+            top, left = max(0, y), max(0, x)
+            bottom, right = min(height, y + h), min(width, x + w)
+            if bottom > top and right > left:
+                face_locations.append((top, right, bottom, left))
+        
+        return face_locations
     
-    def detect_faces_haar(self, image: np.ndarray, fast_mode: bool = True) -> List[Tuple[int, int, int, int]]:
+    def detect_faces_haar(self, image: np.ndarray, fast_mode: bool = True,
+                          gray: np.ndarray = None) -> List[Tuple[int, int, int, int]]:
         """
         Fast face detection using OpenCV Haar Cascade
         
         Args:
             image: BGR image
             fast_mode: If True, uses faster but less accurate settings
+            gray: Grayscale version of image, if already converted
             
         Returns:
             List of face locations as (top, right, bottom, left) - face_recognition format
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
         # Equalize histogram for better detection
         gray = cv2.equalizeHist(gray)
@@ -107,17 +155,20 @@ class FastFaceDetector:
         
         return face_locations
     
-    def detect_faces_alt(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    def detect_faces_alt(self, image: np.ndarray,
+                         gray: np.ndarray = None) -> List[Tuple[int, int, int, int]]:
         """
         Alternative fast face detection using alt Haar cascade
         
         Args:
             image: BGR image
+            gray: Grayscale version of image, if already converted
             
         Returns:
             List of face locations
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
         faces = self.haar_alt.detectMultiScale(
             gray,
@@ -138,17 +189,22 @@ class FastFaceDetector:
         
         Args:
             image: BGR image
-            use_yolo: Ignored, always uses Haar
+            use_yolo: Ignored
             
         Returns:
             List of face locations
         """
-        # Always use Haar cascade - it's fast and reliable
-        locations = self.detect_faces_haar(image, fast_mode=True)
+        if self.yunet_available:
+            return self.detect_faces_yunet(image)
+        
+        # Haar cascade - fast, but misses non-frontal and poorly lit faces.
+        # Both cascades share one grayscale conversion
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        locations = self.detect_faces_haar(image, fast_mode=True, gray=gray)
         
         # Fallback to alt cascade if Haar finds nothing
         if not locations:
-            locations = self.detect_faces_alt(image)
+            locations = self.detect_faces_alt(image, gray=gray)
         
         return locations
 
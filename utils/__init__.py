@@ -1,6 +1,6 @@
 """
 Utility Functions Package
 """
-from .helpers import decode_base64_image, encode_image_to_base64
+from .helpers import decode_base64_image, decode_base64_images, encode_image_to_base64
 
-__all__ = ['decode_base64_image', 'encode_image_to_base64']
+__all__ = ['decode_base64_image', 'decode_base64_images', 'encode_image_to_base64']
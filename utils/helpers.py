@@ -2,41 +2,176 @@
 Helper Utility Functions
 """
 import cv2
+import logging
 import numpy as np
 import base64
-from typing import Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, List, Callable, Union, Any
+from config import Config
 
+logger = logging.getLogger(__name__)
 
-def decode_base64_image(base64_string: str) -> Optional[np.ndarray]:
+try:
+    # SIMD (AVX2/NEON) base64 decoder; falls back to the stdlib
+    from pybase64 import b64decode as _b64decode
+except ImportError:
+    from base64 import b64decode as _b64decode
+
+try:
+    # libjpeg-turbo bindings; need the native libturbojpeg, else cv2 is used
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _turbojpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _turbojpeg = None
+
+_JPEG_MAGIC = b'\xff\xd8'
+
+# Shared pool for image decoding; OpenCV releases the GIL while it works
+_image_executor: Optional[ThreadPoolExecutor] = None
+_image_executor_lock = threading.Lock()
+
+
+# cv2.imdecode flags that let libjpeg scale the image down while decoding
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def decode_base64_image(base64_string: Union[str, bytes], reduce: int = 1) -> Optional[np.ndarray]:
     """
     Decode base64 image string to numpy array (OpenCV BGR format)
     
     Args:
-        base64_string: Base64 encoded image string
+        base64_string: Base64 encoded image (str or bytes, data URL prefix allowed)
+        reduce: Downscale factor applied during decoding (1, 2, 4 or 8)
     
     Returns:
         OpenCV BGR image or None if decoding fails
     """
     try:
         # Remove data URL prefix if present
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
+        comma = base64_string.find(',' if isinstance(base64_string, str) else b',')
+        if comma != -1:
+            base64_string = base64_string[comma + 1:]
         
-        # Decode base64
-        img_data = base64.b64decode(base64_string)
+        image_data = _b64decode(base64_string)
         
-        # Convert to numpy array
-        nparr = np.frombuffer(img_data, np.uint8)
+        # JPEGs go straight to libjpeg-turbo when available (no EXIF rotation;
+        # camera frames from the browser carry none)
+        if _turbojpeg is not None and image_data[:2] == _JPEG_MAGIC:
+            scaling = (1, reduce) if reduce in (2, 4, 8) else None
+            return _turbojpeg.decode(image_data, pixel_format=TJPF_BGR, scaling_factor=scaling)
         
-        # Decode image
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Wrap the bytes without copying
+        nparr = np.frombuffer(image_data, np.uint8)
         
-        return image
+        # Decode image
+        return cv2.imdecode(nparr, _REDUCED_DECODE_FLAGS.get(reduce, cv2.IMREAD_COLOR))
     except Exception as e:
         print(f"Error decoding base64 image: {e}")
         return None
 
 
+def _get_image_executor() -> ThreadPoolExecutor:
+    """Get or create the shared image decoding thread pool"""
+    global _image_executor
+    if _image_executor is not None:
+        return _image_executor
+    with _image_executor_lock:
+        # Re-check: another thread may have created it while we waited
+        if _image_executor is None:
+            _image_executor = ThreadPoolExecutor(
+                max_workers=Config.IMAGE_WORKERS, thread_name_prefix="image-decode"
+            )
+    return _image_executor
+
+
+def submit_base64_images(base64_strings: List[str],
+                         transform: Callable[[np.ndarray], np.ndarray] = None,
+                         reduce: int = 1) -> List[Future]:
+    """
+    Start decoding (and optionally transforming) base64 images in the background
+    
+    Lets the caller do database work while images decode; pass the result to
+    collect_images() to wait for them.
+    
+    Args:
+        base64_strings: Base64 encoded image strings
+        transform: Optional function applied to each decoded image
+        reduce: Downscale factor applied during decoding (1, 2, 4 or 8)
+    
+    Returns:
+        One future per input image
+    """
+    def process(base64_string):
+        try:
+            image = decode_base64_image(base64_string, reduce)
+            if image is not None and transform is not None:
+                image = transform(image)
+            return image
+        except Exception as e:
+            logger.warning("Error processing image: %s", e)
+            return None
+    
+    executor = _get_image_executor()
+    return [executor.submit(process, base64_string) for base64_string in base64_strings]
+
+
+def collect_images(futures: List[Future]) -> List[np.ndarray]:
+    """Wait for submitted images and return those that decoded, in input order"""
+    images = (future.result() for future in futures)
+    return [image for image in images if image is not None]
+
+
+def cancel_images(futures: List[Future]) -> None:
+    """Cancel submitted images that have not started decoding"""
+    for future in futures:
+        future.cancel()
+
+
+def decode_base64_images(base64_strings: List[str],
+                         transform: Callable[[np.ndarray], np.ndarray] = None,
+                         reduce: int = 1) -> List[np.ndarray]:
+    """
+    Decode (and optionally transform) several base64 images in parallel
+    
+    Args:
+        base64_strings: Base64 encoded image strings
+        transform: Optional function applied to each decoded image
+        reduce: Downscale factor applied during decoding (1, 2, 4 or 8)
+    
+    Returns:
+        Images that decoded successfully, in input order
+    """
+    return collect_images(submit_base64_images(base64_strings, transform, reduce))
+
+
+def submit_image_task(func: Callable[..., Any], *args) -> Future:
+    """Run func(*args) on the shared image pool"""
+    return _get_image_executor().submit(func, *args)
+
+
+def map_images(func: Callable[[np.ndarray], Any], images: List[np.ndarray]) -> List[Any]:
+    """Apply func to each image on the shared image pool, results in input order"""
+    return list(_get_image_executor().map(func, images))
+
+
+def exceeds_image_limit(base64_strings) -> bool:
+    """Whether any base64 image is longer than Config.MAX_IMAGE_B64 (checked before decoding)"""
+    return any(isinstance(s, str) and len(s) > Config.MAX_IMAGE_B64 for s in base64_strings)
+
+
+def clamp_page_limit(limit: Optional[int], default: Optional[int] = 50) -> Optional[int]:
+    """Clamp a requested page size to 1..Config.MAX_PAGE_SIZE (None keeps the default)"""
+    if limit is None:
+        return default
+    return max(1, min(limit, Config.MAX_PAGE_SIZE))
+
+
 def encode_image_to_base64(image: np.ndarray, format: str = '.jpg') -> Optional[str]:
     """
     Encode OpenCV image to base64 string
@@ -49,8 +184,11 @@ def encode_image_to_base64(image: np.ndarray, format: str = '.jpg') -> Optional[
         Base64 encoded string or None if encoding fails
     """
     try:
-        # Encode image
-        _, buffer = cv2.imencode(format, image)
+        # Encode image (same quality as cv2's JPEG default)
+        if _turbojpeg is not None and format == '.jpg':
+            buffer = _turbojpeg.encode(image, quality=95, pixel_format=TJPF_BGR)
+        else:
+            _, buffer = cv2.imencode(format, image)
         
         # Convert to base64
         base64_string = base64.b64encode(buffer).decode('utf-8')
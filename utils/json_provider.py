@@ -0,0 +1,33 @@
+"""
+Flask JSON Provider
+Serializes responses and parses request bodies with orjson when available
+
+request.get_json() parses through app.json.loads, so installing the provider
+also covers request bodies without a custom Request class.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, falling back to Flask's defaults for other types"""
+    
+    OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS if orjson else 0
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        """Build the jsonify() response straight from orjson's UTF-8 bytes"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.OPTIONS),
+            mimetype=self.mimetype
+        )